@@ -0,0 +1,202 @@
+"""
+Бенчмарк разборщиков ассортимента и сообщений на синтетических данных (synthetic.py):
+файл ассортимента поставщика (по умолчанию 10 МБ, в основном iPhone и Apple Watch),
+тысячи сообщений о продажах и список прибытия.
+
+    python bench_parsers.py --update-baseline  # снять базовые значения на этой машине
+    python bench_parsers.py                    # сравнить с ними
+
+Каждый запуск меряется в «циклах» – долях калибровочного цикла, выполненного прямо
+перед ним, так что общее замедление машины сокращается. Замер – медиана --repeat
+запусков (все замеры идут по кругу) и её разброс – межквартильный размах относительно
+медианы. Результаты всё равно зависят от машины, поэтому bench_baseline.json не
+хранится в репозитории: его снимают локально, до изменений, и заново после смены
+машины или версии Python.
+
+Замедление считается регрессией, если медиана хуже базовой больше чем на --threshold
+плюс средний разброс двух измерений (шумная машина не даёт ложных срабатываний).
+Код выхода 1 – регрессия; 2 – базовых значений нет или они сняты на других данных
+либо версии Python.
+"""
+import gc
+import os
+import re
+import sys
+import json
+import time
+import statistics
+import random
+import argparse
+import platform
+
+import synthetic
+from sort_assortment import parse_categories, build_output_text, add_item_to_categories
+from client_parser import parse_client_data
+from utils import extract_all_amounts
+from serial_utils import extract_serials_from_text
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+def build_corpus(args) -> dict:
+    rng = random.Random(args.seed)
+    assortment, _ = synthetic.assortment_text(rng, args.assortment_mb * 1024 * 1024)
+    sales = []
+    for _ in range(args.sales):
+        serials = [synthetic.serial(rng) for _ in range(rng.randint(1, 3))]
+        sales.append(synthetic.sale_text(rng, serials))
+    arrival, _ = synthetic.arrival_text(rng, args.arrivals)
+    lines = assortment.splitlines()
+    return {
+        'assortment_lines': lines,
+        'categories': parse_categories(lines),
+        'sales': sales,
+        'arrival_lines': arrival.splitlines(),
+    }
+
+def _copy_categories(categories: list) -> list:
+    return [{'header': cat['header'], 'items': list(cat['items'])} for cat in categories]
+
+def _add_items(lines: list, categories: list):
+    for line in lines:
+        categories, _ = add_item_to_categories(line, categories)
+
+# Имя замера -> (подготовка данных вне замера, замеряемая функция)
+BENCHMARKS = {
+    'parse_categories': (lambda corpus: (corpus['assortment_lines'],), parse_categories),
+    'build_output_text': (lambda corpus: (corpus['categories'],), build_output_text),
+    'add_item_to_categories': (
+        lambda corpus: (corpus['arrival_lines'], _copy_categories(corpus['categories'])), _add_items),
+    'parse_client_data': (lambda corpus: (corpus['sales'],), lambda texts: [parse_client_data(t) for t in texts]),
+    'extract_all_amounts': (lambda corpus: (corpus['sales'],), lambda texts: [extract_all_amounts(t) for t in texts]),
+    'extract_serials_from_text': (
+        lambda corpus: (corpus['sales'],), lambda texts: [extract_serials_from_text(t) for t in texts]),
+}
+
+CALIBRATION_TEXT = 'iPhone 16 Pro 256GB Black Titanium (ABCDEFGHIJ1) - 120000 ₽\n' * 200
+CALIBRATION_RE = re.compile(r'\(([A-Z0-9]{11})\)|(\d+)')
+
+def calibration_loop():
+    """Постоянная нагрузка того же рода, что и разборщики (строки, словари, regex) – мерило скорости машины."""
+    counts = {}
+    for _ in range(100):
+        for line in CALIBRATION_TEXT.splitlines():
+            for word in line.lower().split():
+                counts[word] = counts.get(word, 0) + 1
+        CALIBRATION_RE.findall(CALIBRATION_TEXT)
+    return counts
+
+def _timed(func, *args) -> float:
+    # Как в timeit: сборщик мусора не вмешивается в замер (корпус большой, паузы случайны)
+    gc.collect()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - started
+    finally:
+        gc.enable()
+
+def measure(corpus: dict, names: list[str], repeat: int) -> tuple[dict[str, list[float]], dict[str, list[float]]]:
+    """
+    Время запусков (с) и оно же в единицах калибровочного цикла, выполненного прямо перед
+    запуском: общее замедление машины на время замера сокращается.
+    """
+    seconds = {name: [] for name in names}
+    relative = {name: [] for name in names}
+    for _ in range(repeat):
+        for name in names:
+            prepare, func = BENCHMARKS[name]
+            args = prepare(corpus)
+            calibration = _timed(calibration_loop)
+            elapsed = _timed(func, *args)
+            seconds[name].append(elapsed)
+            relative[name].append(elapsed / calibration)
+    return seconds, relative
+
+def summarize(values: list[float]) -> dict[str, float]:
+    """Медиана и разброс замера: межквартильный размах, делённый на медиану."""
+    median = statistics.median(values)
+    first, _, third = statistics.quantiles(values, n=4)
+    return {'median': median, 'spread': (third - first) / median}
+
+def corpus_params(args) -> dict:
+    return {'assortment_mb': args.assortment_mb, 'sales': args.sales, 'arrivals': args.arrivals, 'seed': args.seed}
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Бенчмарк разборщиков')
+    parser.add_argument('--assortment-mb', type=float, default=10, help='размер файла ассортимента, МБ')
+    parser.add_argument('--sales', type=int, default=5000, help='число сообщений о продажах')
+    parser.add_argument('--arrivals', type=int, default=2000, help='строк в прибытии для add_item_to_categories')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=9, help='запусков каждого замера (не меньше 2)')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='допустимое замедление сверх разброса (0.25 = 25%%)')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='запустить только эти замеры')
+    args = parser.parse_args()
+    if args.repeat < 2:
+        parser.error('--repeat должен быть не меньше 2')
+
+    names = args.only or list(BENCHMARKS)
+    print(f"Генерация данных: ассортимент {args.assortment_mb:g} МБ, продаж {args.sales}, прибытие {args.arrivals}...")
+    corpus = build_corpus(args)
+    print(f"Категорий: {len(corpus['categories'])}, строк ассортимента: {len(corpus['assortment_lines'])}")
+    seconds, relative = measure(corpus, names, args.repeat)
+    results = {name: summarize(values) for name, values in relative.items()}
+
+    try:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = None
+    mismatch = None
+    if baseline is None:
+        mismatch = f"нет файла {args.baseline}"
+    elif baseline.get('corpus') != corpus_params(args):
+        mismatch = f"сняты на других данных ({baseline.get('corpus')})"
+    elif baseline.get('python') != platform.python_version():
+        mismatch = f"сняты на Python {baseline.get('python')}, сейчас {platform.python_version()}"
+    if mismatch:
+        baseline = None
+
+    regressions = []
+    print(f"\n{'замер':<28}{'мс':>10}{'циклов':>9}{'разброс':>9}{'база':>9}{'изменение':>11}{'допуск':>9}")
+    for name in names:
+        result = results[name]
+        line = (f"{name:<28}{statistics.median(seconds[name]) * 1000:>10.1f}"
+                f"{result['median']:>9.2f}{result['spread']:>9.0%}")
+        base = baseline and baseline['results'].get(name)
+        if isinstance(base, dict):
+            change = result['median'] / base['median'] - 1
+            allowed = args.threshold + (base['spread'] + result['spread']) / 2
+            line += f"{base['median']:>9.2f}{change:>+11.0%}{allowed:>+9.0%}"
+            if change > allowed:
+                regressions.append(name)
+                line += '  ❌'
+        elif baseline:
+            mismatch = f"нет базового значения для {name}"
+        print(line)
+
+    if args.update_baseline:
+        # Значения старого формата (одно число – лучшее время) не сохраняются
+        stored = {name: value for name, value in baseline['results'].items() if isinstance(value, dict)} \
+            if baseline else {}
+        stored.update({name: results[name] for name in names})
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'corpus': corpus_params(args), 'python': platform.python_version(), 'results': stored},
+                      f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nБазовые значения записаны в {args.baseline}")
+        return 0
+    if mismatch:
+        # Без сравнения проверка не должна молча проходить
+        print(f"\n❌ Базовые значения не подходят: {mismatch}. Снимите их заново: --update-baseline")
+        return 2
+    if regressions:
+        print(f"\n❌ Замедление больше допуска: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -33,7 +33,7 @@ def parse_client_data(text: str) -> dict:
                 clean_phone = '+7' + clean_phone[1:]
             if clean_phone not in result['phones']:
                 result['phones'].append(clean_phone)
-                logger.info(f"📞 Найден телефон: {clean_phone}")
+                logger.debug("📞 Найден телефон: %s", clean_phone)
 
         # ФИО
         if not result['full_name']:
@@ -81,7 +81,7 @@ def parse_client_data(text: str) -> dict:
                 try:
                     price = float(price_str)
                 except ValueError:
-                    logger.debug(f"Не удалось распарсить цену из '{price_str}'")
+                    logger.debug("Не удалось распарсить цену из '%s'", price_str)
                     price = None
             else:
                 price = None
@@ -98,5 +98,5 @@ def parse_client_data(text: str) -> dict:
     result['total'] = sum(result['payments'].values())
     result['main_phone'] = result['phones'][0] if result['phones'] else None
 
-    logger.info(f"📋 Распарсенные данные: {result}")
+    logger.debug("📋 Распарсенные данные: %s", result)
     return result
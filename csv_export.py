@@ -0,0 +1,59 @@
+import csv
+import io
+import zlib
+from aiogram.types import InputFile
+
+from database import iter_rows
+from workers import run_report
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_BATCH_ROWS = 500
+
+class CsvExportFile(InputFile):
+    """
+    CSV-отчёт, который формируется прямо во время отправки в Telegram.
+    Строки читаются из БД серверным курсором порциями и сразу кодируются,
+    поэтому память не зависит от размера таблицы. При compress=True файл сжимается gzip.
+    """
+
+    def __init__(self, filename: str, header: list, query: str, *args,
+                 row_builder=None, compress: bool = False):
+        if compress:
+            filename += '.gz'
+        super().__init__(filename=filename, chunk_size=EXPORT_CHUNK_SIZE)
+        self.header = header
+        self.query = query
+        self.args = args
+        self.row_builder = row_builder or (lambda row: list(row.values()))
+        self.compress = compress
+
+    async def read(self, bot):
+        # wbits=31 – формат gzip
+        self._compressor = zlib.compressobj(wbits=31) if self.compress else None
+        header = self.header
+        batch = []
+        async for row in iter_rows(self.query, *self.args, prefetch=EXPORT_BATCH_ROWS):
+            batch.append(row)
+            if len(batch) >= EXPORT_BATCH_ROWS:
+                # Форматирование и сжатие порции – в пуле потоков, event loop не блокируется
+                chunk = await run_report(self._encode_batch, batch, header)
+                batch = []
+                header = None
+                if chunk:
+                    yield chunk
+        chunk = await run_report(self._encode_batch, batch, header, True)
+        if chunk:
+            yield chunk
+
+    def _encode_batch(self, batch: list, header: list | None = None, final: bool = False) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if header:
+            writer.writerow(header)
+        for row in batch:
+            writer.writerow(self.row_builder(row))
+        data = buffer.getvalue().encode('utf-8')
+        if not self._compressor:
+            return data
+        data = self._compressor.compress(data)
+        return data + self._compressor.flush() if final else data
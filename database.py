@@ -1,12 +1,17 @@
 import os
+import time
 import asyncpg
 import json
 import logging
 import asyncio
+from collections import Counter
+from contextvars import ContextVar
 from datetime import date, datetime
 from functools import wraps
 
 import config
+import metrics
+from sort_assortment import get_item_attributes, get_full_model_name
 
 logger = logging.getLogger(__name__)
 
@@ -14,32 +19,110 @@ DATABASE_URL = os.environ.get('DATABASE_URL')
 if not DATABASE_URL:
     raise ValueError("❌ DATABASE_URL не задан в переменных окружения!")
 
+# ---------- Замеры запросов ----------
+# Вызовы дольше порога пишутся в лог (0 – не писать); DB_EXPLAIN_SLOW=1 – добавлять план самого долгого SELECT
+DB_SLOW_CALL_MS = float(os.environ.get('DB_SLOW_CALL_MS', 500))
+DB_EXPLAIN_SLOW = os.environ.get('DB_EXPLAIN_SLOW', '0') == '1'
+
+# Имя обработчика aiogram, из которого идут запросы (задаётся middleware в server.py)
+db_caller: ContextVar[str | None] = ContextVar('db_caller', default=None)
+# Запросы текущего вызова функции БД (заполняется логгером запросов asyncpg)
+_call_queries: ContextVar[list | None] = ContextVar('call_queries', default=None)
+_slow_call_reports: set[asyncio.Task] = set()
+
+def _redact(value) -> str:
+    """Параметр запроса для лога: только тип и размер, без данных клиентов."""
+    if value is None or isinstance(value, bool):
+        return repr(value)
+    if isinstance(value, (str, bytes, list, tuple, dict, set)):
+        return f"<{type(value).__name__}:{len(value)}>"
+    return f"<{type(value).__name__}>"
+
+def _log_query(record):
+    queries = _call_queries.get()
+    # Служебный сброс соединения при возврате в пул не считаем
+    if queries is not None and not record.query.startswith('SELECT pg_advisory_unlock_all()'):
+        queries.append(record)
+
+async def _explain(query: str, args: tuple) -> str:
+    """План выполнения SELECT с ANALYZE; транзакция откатывается, так что данные не меняются."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            rows = await conn.fetch(f'EXPLAIN (ANALYZE, BUFFERS) {query}', *args)
+        finally:
+            await transaction.rollback()
+    return '\n'.join(row[0] for row in rows)
+
+async def _report_slow_call(name: str, handler: str, elapsed: float, args: tuple, kwargs: dict, queries: list):
+    # Задача запускается после колбэков логгера запросов, так что queries уже заполнен
+    _call_queries.set(None)
+    params = ', '.join([_redact(arg) for arg in args] + [f"{key}={_redact(value)}" for key, value in kwargs.items()])
+    p95 = metrics.DB_CALL_LATENCY.percentiles(function=name, handler=handler).get(0.95)
+    slowest = max(queries, key=lambda record: record.elapsed, default=None)
+    message = (f"🐢 Медленный вызов БД {name}({params}) из {handler}: {elapsed * 1000:.0f} мс"
+               f"{f', p95 {p95 * 1000:.0f} мс' if p95 is not None else ''}, запросов: {len(queries)}")
+    if slowest:
+        message += f"\nСамый долгий ({slowest.elapsed * 1000:.0f} мс): {' '.join(slowest.query.split())}"
+    if DB_EXPLAIN_SLOW and slowest and slowest.query.lstrip().upper().startswith('SELECT'):
+        try:
+            message += '\n' + await _explain(slowest.query, slowest.args)
+        except Exception as e:
+            message += f"\nEXPLAIN не удался: {e}"
+    logger.warning(message)
+
 # ---------- Декоратор для повторных попыток ----------
 def retry_on_db_error(retries=3, delay=1, backoff=2):
     """
     Декоратор для асинхронных функций, выполняющих запросы к БД.
     При ошибках соединения повторяет вызов до retries раз.
+    Время вызовов (вместе с повторами) и ошибки попадают в метрики
+    с разбивкой по вызывающему обработчику; медленные вызовы пишутся в лог.
     """
     def decorator(func):
+        name = func.__name__
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
+            handler = db_caller.get() or '-'
+            queries = [] if DB_SLOW_CALL_MS > 0 else None
+            token = _call_queries.set(queries)
+            started = time.perf_counter()
+            try:
+                return await call_with_retries(*args, **kwargs)
+            except Exception as e:
+                metrics.DB_CALL_ERRORS.inc(function=name, error=type(e).__name__)
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                _call_queries.reset(token)
+                metrics.DB_CALL_SECONDS.observe(elapsed, function=name)
+                metrics.DB_CALL_LATENCY.observe(elapsed, function=name, handler=handler)
+                if queries is not None and elapsed * 1000 >= DB_SLOW_CALL_MS:
+                    task = asyncio.create_task(_report_slow_call(name, handler, elapsed, args, kwargs, queries))
+                    _slow_call_reports.add(task)
+                    task.add_done_callback(_slow_call_reports.discard)
+
+        async def call_with_retries(*args, **kwargs):
             last_exception = None
             for attempt in range(retries):
                 try:
                     return await func(*args, **kwargs)
-                except (asyncpg.exceptions.ConnectionFailureError,
+                except (OSError,
+                        asyncpg.exceptions.ConnectionFailureError,
                         asyncpg.exceptions.ConnectionDoesNotExistError,
                         asyncpg.exceptions.InterfaceError,
                         asyncpg.exceptions.ConnectionRejectionError,
-                        asyncpg.exceptions.ConnectionNotInitializedError,
                         asyncpg.exceptions.PostgresConnectionError) as e:
                     last_exception = e
                     if attempt < retries - 1:
                         wait = delay * (backoff ** attempt)
-                        logger.warning(f"Ошибка БД (попытка {attempt+1}/{retries}): {e}. Повтор через {wait}с")
+                        logger.warning("Ошибка БД (попытка %s/%s): %s. Повтор через %sс", attempt+1, retries, e, wait)
                         await asyncio.sleep(wait)
                     else:
-                        logger.error(f"Все попытки исчерпаны: {e}")
+                        logger.error("Все попытки исчерпаны: %s", e)
                         raise
                 except Exception as e:
                     # Другие ошибки не повторяем
@@ -51,20 +134,101 @@ def retry_on_db_error(retries=3, delay=1, backoff=2):
 # ---------- Пул соединений ----------
 _pool = None
 
+class _AcquireTimer:
+    """pool.acquire(), замеряющий ожидание свободного соединения."""
+
+    def __init__(self, acquire):
+        self._acquire = acquire
+
+    async def _timed(self):
+        started = time.perf_counter()
+        try:
+            return await self._acquire.__aenter__()
+        finally:
+            metrics.DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+    async def __aenter__(self):
+        return await self._timed()
+
+    async def __aexit__(self, *exc):
+        return await self._acquire.__aexit__(*exc)
+
+class MeteredPool:
+    """Обёртка пула asyncpg: ожидание соединения (и в запросах через сам пул) попадает в метрики."""
+
+    def __init__(self, pool: asyncpg.Pool):
+        self._pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    def acquire(self, *, timeout=None):
+        return _AcquireTimer(self._pool.acquire(timeout=timeout))
+
+    async def execute(self, query: str, *args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.execute(query, *args, timeout=timeout)
+
+    async def executemany(self, command: str, args, *, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.executemany(command, args, timeout=timeout)
+
+    async def fetch(self, query: str, *args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.fetch(query, *args, timeout=timeout)
+
+    async def fetchrow(self, query: str, *args, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.fetchrow(query, *args, timeout=timeout)
+
+    async def fetchval(self, query: str, *args, column=0, timeout=None):
+        async with self.acquire() as conn:
+            return await conn.fetchval(query, *args, column=column, timeout=timeout)
+
+def _pool_connections():
+    if _pool is None:
+        return {}
+    return {'total': _pool.get_size(), 'idle': _pool.get_idle_size()}
+
+metrics.Gauge('bot_db_pool_connections', 'Соединения в пуле', ('state',), callback=_pool_connections)
+
+async def _init_connection(conn):
+    """JSONB-колонки читаются и пишутся как объекты Python; запросы замеряются для лога медленных вызовов."""
+    await conn.set_type_codec(
+        'jsonb',
+        encoder=lambda value: json.dumps(value, ensure_ascii=False),
+        decoder=json.loads,
+        schema='pg_catalog'
+    )
+    if DB_SLOW_CALL_MS > 0:
+        conn.add_query_logger(_log_query)
+
 async def get_pool():
     """Возвращает пул соединений (создаёт при первом вызове)."""
     global _pool
     if _pool is None:
-        _pool = await asyncpg.create_pool(
+        _pool = MeteredPool(await asyncpg.create_pool(
             DATABASE_URL,
             min_size=5,
             max_size=20,
             command_timeout=60,
-            max_inactive_connection_lifetime=300
-        )
+            max_inactive_connection_lifetime=300,
+            init=_init_connection
+        ))
         logger.info("✅ Пул соединений создан")
     return _pool
 
+async def iter_rows(query: str, *args, prefetch: int = 500):
+    """
+    Асинхронно отдаёт строки результата запроса, читая их серверным курсором
+    порциями по prefetch строк (для больших выгрузок).
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            async for row in conn.cursor(query, *args, prefetch=prefetch):
+                yield row
+
 async def init_db():
     """Создаёт таблицы и индексы, если их нет."""
     pool = await get_pool()
@@ -87,10 +251,10 @@ async def init_db():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        # Таблица продаж
+        # Таблица продаж (секционирована по месяцам, как и предзаказы, брони и покупки)
         await conn.execute('''
             CREATE TABLE IF NOT EXISTS sales (
-                id SERIAL PRIMARY KEY,
+                id SERIAL,
                 item_id INTEGER REFERENCES items(id) ON DELETE SET NULL,
                 count INTEGER DEFAULT 1,
                 cash REAL DEFAULT 0,
@@ -98,28 +262,31 @@ async def init_db():
                 qr REAL DEFAULT 0,
                 installment REAL DEFAULT 0,
                 is_accessory BOOLEAN DEFAULT FALSE,
-                sold_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
+                sold_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, sold_at)
+            ) PARTITION BY RANGE (sold_at)
         ''')
         # Таблица предзаказов
         await conn.execute('''
             CREATE TABLE IF NOT EXISTS preorders (
-                id SERIAL PRIMARY KEY,
+                id SERIAL,
                 cash REAL DEFAULT 0,
                 terminal REAL DEFAULT 0,
                 qr REAL DEFAULT 0,
                 installment REAL DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at)
         ''')
         # Таблица броней
         await conn.execute('''
             CREATE TABLE IF NOT EXISTS bookings (
-                id SERIAL PRIMARY KEY,
-                item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+                id SERIAL,
+                item_id INTEGER REFERENCES items(id) ON DELETE SET NULL,
                 total_amount REAL DEFAULT 0,
-                booked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
+                booked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, booked_at)
+            ) PARTITION BY RANGE (booked_at)
         ''')
         # Таблица клиентов
         await conn.execute('''
@@ -138,12 +305,39 @@ async def init_db():
         # Таблица покупок
         await conn.execute('''
             CREATE TABLE IF NOT EXISTS purchases (
-                id SERIAL PRIMARY KEY,
+                id SERIAL,
                 client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
-                items_json TEXT,
+                items_json JSONB,
                 total_amount REAL,
-                payment_details TEXT,
+                payment_details JSONB,
                 purchase_type TEXT,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at)
+        ''')
+        # Таблицы, созданные до секционирования, переносятся в секционированные
+        for table in PARTITIONED_TABLES:
+            await _partition_table(conn, table)
+        await _ensure_partitions(conn)
+        # Брони – история для статистики, как и продажи: продажа или снятие брони удаляет
+        # товар, но не бронь (иначе пересчёт daily_summary занижал бы прошлые брони)
+        cascade = await conn.fetchval('''
+            SELECT conname FROM pg_constraint
+            WHERE conrelid = 'bookings'::regclass AND contype = 'f' AND confdeltype = 'c'
+        ''')
+        if cascade:
+            await conn.execute(f'''
+                ALTER TABLE bookings
+                    DROP CONSTRAINT {cascade},
+                    ALTER COLUMN item_id DROP NOT NULL,
+                    ADD FOREIGN KEY (item_id) REFERENCES items(id) ON DELETE SET NULL
+            ''')
+        # Готовые отчёты за закрытые месяцы
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS month_reports (
+                month TEXT PRIMARY KEY,
+                csv BYTEA NOT NULL,
+                file_id TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
@@ -155,33 +349,460 @@ async def init_db():
         await conn.execute('CREATE INDEX IF NOT EXISTS idx_clients_created_at ON clients(created_at)')
         await conn.execute('CREATE INDEX IF NOT EXISTS idx_purchases_created_at ON purchases(created_at)')
         await conn.execute('CREATE INDEX IF NOT EXISTS idx_items_is_booked ON items(is_booked)')
+        # Покупки в JSONB (раньше хранились текстом). Старые строки бывают невалидным JSON –
+        # такие сохраняются JSON-строкой с исходным текстом, а не прерывают init_db
+        text_columns = await conn.fetch('''
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = 'purchases' AND column_name IN ('items_json', 'payment_details')
+              AND data_type = 'text'
+        ''')
+        if text_columns:
+            await conn.execute('''
+                CREATE OR REPLACE FUNCTION pg_temp.jsonb_or_text(value TEXT) RETURNS JSONB AS $$
+                BEGIN
+                    RETURN NULLIF(value, '')::jsonb;
+                EXCEPTION WHEN others THEN
+                    RETURN to_jsonb(value);
+                END
+                $$ LANGUAGE plpgsql IMMUTABLE
+            ''')
+        for row in text_columns:
+            column = row['column_name']
+            await conn.execute(
+                f"ALTER TABLE purchases ALTER COLUMN {column} TYPE JSONB USING pg_temp.jsonb_or_text({column})"
+            )
+            wrapped = await conn.fetchval(
+                f"SELECT COUNT(*) FROM purchases WHERE jsonb_typeof({column}) = 'string'"
+            )
+            logger.info("✅ Колонка purchases.%s переведена в JSONB", column)
+            if wrapped:
+                logger.warning("⚠️ purchases.%s: %s строк не были валидным JSON и сохранены как текст", column, wrapped)
+        # Модели товаров дописываются один раз – при переводе items_json в JSONB;
+        # новые покупки пишутся уже с моделью (add_purchase)
+        if any(row['column_name'] == 'items_json' for row in text_columns):
+            rows = await conn.fetch('''
+                SELECT id, items_json FROM purchases
+                WHERE jsonb_typeof(items_json) = 'array'
+                  AND jsonb_path_exists(items_json, '$[*] ? (!exists(@.model))')
+            ''')
+            if rows:
+                await conn.executemany(
+                    'UPDATE purchases SET items_json = $2 WHERE id = $1',
+                    [(row['id'], _purchase_items(row['items_json'])) for row in rows]
+                )
+                logger.info("✅ Добавлены модели товаров в %s покупок", len(rows))
+        # Поиск покупок по модели: items_json @> '[{"model": ...}]'
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_purchases_items ON purchases USING gin (items_json jsonb_path_ops)')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_purchases_payment ON purchases USING gin (payment_details)')
+        # hash-индекс: строки товаров бывают длиннее лимита записи btree
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_items_text ON items USING hash (text)')
+        # Разобранные характеристики товаров (для группировки остатков в SQL)
+        await conn.execute('''
+            ALTER TABLE items
+                ADD COLUMN IF NOT EXISTS model_name TEXT,
+                ADD COLUMN IF NOT EXISTS base_name TEXT,
+                ADD COLUMN IF NOT EXISTS memory TEXT,
+                ADD COLUMN IF NOT EXISTS sim_type TEXT,
+                ADD COLUMN IF NOT EXISTS watch_size INTEGER
+        ''')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_items_model_sim ON items(model_name, sim_type)')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_items_base_name ON items(base_name)')
+        rows = await conn.fetch('SELECT id, text FROM items WHERE model_name IS NULL')
+        if rows:
+            await conn.executemany('''
+                UPDATE items SET model_name = $2, base_name = $3, memory = $4, sim_type = $5, watch_size = $6
+                WHERE id = $1
+            ''', [(row['id'], *_item_attribute_values(row['text'])) for row in rows])
+            logger.info("✅ Заполнены характеристики для %s товаров", len(rows))
+        # Остатки по (модель, тип SIM), поддерживаются при каждом изменении items
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS stock_levels (
+                model_name TEXT NOT NULL,
+                sim_type TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (model_name, sim_type)
+            )
+        ''')
+        if not await conn.fetchval('SELECT EXISTS (SELECT 1 FROM stock_levels)'):
+            async with conn.transaction():
+                await _rebuild_stock_levels(conn)
+        # Итоги по дням, обновляются вместе с записью продаж, предзаказов и броней
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS daily_summary (
+                day DATE NOT NULL,
+                epoch INTEGER NOT NULL DEFAULT 0,
+                reset_at TIMESTAMP,
+                sales INTEGER NOT NULL DEFAULT 0,
+                sales_cash DOUBLE PRECISION NOT NULL DEFAULT 0,
+                sales_terminal DOUBLE PRECISION NOT NULL DEFAULT 0,
+                sales_qr DOUBLE PRECISION NOT NULL DEFAULT 0,
+                sales_installment DOUBLE PRECISION NOT NULL DEFAULT 0,
+                preorders INTEGER NOT NULL DEFAULT 0,
+                preorders_cash DOUBLE PRECISION NOT NULL DEFAULT 0,
+                preorders_terminal DOUBLE PRECISION NOT NULL DEFAULT 0,
+                preorders_qr DOUBLE PRECISION NOT NULL DEFAULT 0,
+                preorders_installment DOUBLE PRECISION NOT NULL DEFAULT 0,
+                bookings INTEGER NOT NULL DEFAULT 0,
+                bookings_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, epoch)
+            )
+        ''')
+        # Сброс статистики – новая «эпоха» дня, строки продаж при этом не удаляются
+        if not await conn.fetchval('''
+            SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_name = 'daily_summary' AND column_name = 'epoch')
+        '''):
+            await conn.execute('''
+                ALTER TABLE daily_summary
+                    ADD COLUMN epoch INTEGER NOT NULL DEFAULT 0,
+                    ADD COLUMN reset_at TIMESTAMP,
+                    DROP CONSTRAINT daily_summary_pkey,
+                    ADD PRIMARY KEY (day, epoch)
+            ''')
+        # Суммы по способам оплаты и итог дня считает сама БД при каждом обновлении строки
+        await conn.execute('''
+            ALTER TABLE daily_summary
+                ADD COLUMN IF NOT EXISTS terminal DOUBLE PRECISION
+                    GENERATED ALWAYS AS (sales_terminal + preorders_terminal) STORED,
+                ADD COLUMN IF NOT EXISTS cash DOUBLE PRECISION
+                    GENERATED ALWAYS AS (sales_cash + preorders_cash) STORED,
+                ADD COLUMN IF NOT EXISTS qr DOUBLE PRECISION
+                    GENERATED ALWAYS AS (sales_qr + preorders_qr) STORED,
+                ADD COLUMN IF NOT EXISTS installment DOUBLE PRECISION
+                    GENERATED ALWAYS AS (sales_installment + preorders_installment) STORED,
+                ADD COLUMN IF NOT EXISTS total DOUBLE PRECISION
+                    GENERATED ALWAYS AS (sales_terminal + preorders_terminal + sales_cash + preorders_cash +
+                                         sales_qr + preorders_qr + sales_installment + preorders_installment +
+                                         bookings_total) STORED
+        ''')
+        if not await conn.fetchval('SELECT EXISTS (SELECT 1 FROM daily_summary)'):
+            async with conn.transaction():
+                await _rebuild_daily_summary(conn)
+        # Состояния FSM (см. fsm_storage.PostgresStorage); версия берётся из общей
+        # последовательности и меняется при каждой записи – по ней процессы сверяют кеш
+        await conn.execute('CREATE SEQUENCE IF NOT EXISTS fsm_storage_version')
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS fsm_storage (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data BYTEA,
+                version BIGINT NOT NULL DEFAULT nextval('fsm_storage_version'),
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        await conn.execute('''
+            ALTER TABLE fsm_storage
+                ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT nextval('fsm_storage_version')
+        ''')
+        # Последние отправленные ботом сообщения (см. message_registry.MessageRegistry)
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS tracked_messages (
+                kind TEXT NOT NULL,
+                chat_id BIGINT NOT NULL,
+                message_ids BIGINT[] NOT NULL,
+                sent_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (kind, chat_id)
+            )
+        ''')
+        # Версии данных: растут при любом изменении таблиц (в том числе прямыми запросами)
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS data_versions (
+                name TEXT PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            )
+        ''')
+        await conn.execute('''
+            CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO data_versions (name, version) VALUES (TG_ARGV[0], 1)
+                ON CONFLICT (name) DO UPDATE SET version = data_versions.version + 1;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        for table, name in DATA_VERSION_TABLES.items():
+            async with conn.transaction():
+                await conn.execute(f'DROP TRIGGER IF EXISTS {table}_data_version ON {table}')
+                await conn.execute(f'''
+                    CREATE TRIGGER {table}_data_version
+                    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                    FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version('{name}')
+                ''')
+        # Отчёты за закрытые месяцы включают текущие данные клиентов: любое изменение
+        # или удаление клиентов и покупок сбрасывает их (новые покупки попадают в текущий месяц)
+        await conn.execute('''
+            CREATE OR REPLACE FUNCTION clear_month_reports() RETURNS trigger AS $$
+            BEGIN
+                DELETE FROM month_reports;
+                INSERT INTO data_versions (name, version) VALUES ('month_reports', 1)
+                ON CONFLICT (name) DO UPDATE SET version = data_versions.version + 1;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        for table in ('clients', 'purchases'):
+            async with conn.transaction():
+                await conn.execute(f'DROP TRIGGER IF EXISTS {table}_month_reports ON {table}')
+                await conn.execute(f'''
+                    CREATE TRIGGER {table}_month_reports
+                    AFTER UPDATE OR DELETE OR TRUNCATE ON {table}
+                    FOR EACH STATEMENT EXECUTE FUNCTION clear_month_reports()
+                ''')
+
+# ---------- Секционирование по месяцам ----------
+
+# Таблица -> (колонка времени, внешний ключ для восстановления при переносе)
+PARTITIONED_TABLES = {
+    'sales': ('sold_at', 'FOREIGN KEY (item_id) REFERENCES items(id) ON DELETE SET NULL'),
+    'preorders': ('created_at', None),
+    'bookings': ('booked_at', 'FOREIGN KEY (item_id) REFERENCES items(id) ON DELETE SET NULL'),
+    'purchases': ('created_at', 'FOREIGN KEY (client_id) REFERENCES clients(id) ON DELETE CASCADE'),
+}
+PARTITION_MONTHS_AHEAD = 3
+
+def _month_start(day: date, shift: int = 0) -> date:
+    index = day.year * 12 + day.month - 1 + shift
+    return date(index // 12, index % 12 + 1, 1)
+
+async def _create_partition(conn, table: str, month: date):
+    """Создаёт секцию table_YYYY_MM; строки этого месяца из секции по умолчанию переносятся в неё."""
+    column = PARTITIONED_TABLES[table][0]
+    name = f'{table}_{month:%Y_%m}'
+    start, end = month, _month_start(month, 1)
+    if await conn.fetchval('SELECT to_regclass($1) IS NOT NULL', name):
+        return
+    async with conn.transaction():
+        stray = await conn.fetchval(
+            f'SELECT EXISTS (SELECT 1 FROM {table}_default WHERE {column} >= $1 AND {column} < $2)',
+            start, end
+        )
+        if not stray:
+            await conn.execute(
+                f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM ('{start}') TO ('{end}')"
+            )
+            return
+        # Месяц уже попал в секцию по умолчанию (например, бот долго не перезапускался)
+        await conn.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)')
+        await conn.execute(f'''
+            WITH moved AS (
+                DELETE FROM {table}_default WHERE {column} >= $1 AND {column} < $2 RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        ''', start, end)
+        await conn.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+
+async def _ensure_partitions(conn, today: date | None = None):
+    """Секции по умолчанию и на текущий и PARTITION_MONTHS_AHEAD следующих месяцев."""
+    month = _month_start(today or date.today())
+    for table in PARTITIONED_TABLES:
+        await conn.execute(f'CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT')
+        for shift in range(PARTITION_MONTHS_AHEAD + 1):
+            await _create_partition(conn, table, _month_start(month, shift))
+
+async def _partition_table(conn, table: str):
+    """Переносит обычную таблицу в секционированную с теми же колонками и данными."""
+    if not await conn.fetchval("SELECT relkind = 'r' FROM pg_class WHERE oid = to_regclass($1)", table):
+        return
+    column, foreign_key = PARTITIONED_TABLES[table]
+    old = f'{table}_unpartitioned'
+    async with conn.transaction():
+        await conn.execute(f'ALTER TABLE {table} RENAME TO {old}')
+        await conn.execute(f'UPDATE {old} SET {column} = CURRENT_TIMESTAMP WHERE {column} IS NULL')
+        await conn.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE ({column})')
+        await conn.execute(f'ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL')
+        sequence = await conn.fetchval("SELECT pg_get_serial_sequence($1, 'id')", old)
+        await conn.execute(f'ALTER SEQUENCE {sequence} OWNED BY {table}.id')
+        await conn.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+        first, last = await conn.fetchrow(f'SELECT MIN({column}), MAX({column}) FROM {old}')
+        if first:
+            month = _month_start(first.date())
+            while month <= last.date():
+                await _create_partition(conn, table, month)
+                month = _month_start(month, 1)
+        await conn.execute(f'INSERT INTO {table} SELECT * FROM {old}')
+        await conn.execute(f'DROP TABLE {old}')
+        await conn.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, {column})')
+        if foreign_key:
+            await conn.execute(f'ALTER TABLE {table} ADD {foreign_key}')
+    logger.info("✅ Таблица %s секционирована по месяцам", table)
+
+@retry_on_db_error()
+async def ensure_partitions():
+    """Создаёт секции на ближайшие месяцы (вызывается при старте и из /migrate)."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await _ensure_partitions(conn)
+
+async def _attached_months(conn, table: str) -> list[tuple[str, date]]:
+    """Присоединённые месячные секции таблицы: (имя секции, первый день месяца) по возрастанию."""
+    rows = await conn.fetch('''
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass($1) AND c.relname ~ '_[0-9]{4}_[0-9]{2}$'
+        ORDER BY c.relname
+    ''', table)
+    result = []
+    for row in rows:
+        year, month = map(int, row['relname'].rsplit('_', 2)[1:])
+        result.append((row['relname'], date(year, month, 1)))
+    return result
+
+async def _month_partitions(conn, before: date) -> list[tuple[str, str]]:
+    """Месячные секции (таблица, секция), целиком лежащие раньше before."""
+    result = []
+    for table in PARTITIONED_TABLES:
+        for name, month in await _attached_months(conn, table):
+            if _month_start(month, 1) <= before:
+                result.append((table, name))
+    return result
+
+async def _attached_since(conn) -> date | None:
+    """
+    Первый день, данные за который ещё присоединены (самая старая месячная секция или
+    запись в секции по умолчанию). Более ранние месяцы отсоединены archive_partitions.
+    """
+    days = []
+    for table, (column, _) in PARTITIONED_TABLES.items():
+        months = await _attached_months(conn, table)
+        if months:
+            days.append(months[0][1])
+        stray = await conn.fetchval(f'SELECT MIN({column})::date FROM {table}_default')
+        if stray:
+            days.append(stray)
+    return min(days, default=None)
+
+@retry_on_db_error()
+async def month_partitions(before: date) -> list[str]:
+    """Имена секций, которые отсоединит archive_partitions(before)."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return [name for _, name in await _month_partitions(conn, before)]
+
+@retry_on_db_error()
+async def archive_partitions(before: date) -> list[str]:
+    """
+    Отсоединяет месячные секции, целиком лежащие раньше before (все в одной транзакции).
+    Данные остаются в отдельных таблицах table_YYYY_MM, но больше не участвуют в запросах.
+    Возвращает имена отсоединённых таблиц.
+    """
+    pool = await get_pool()
+    detached = []
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            for table, name in await _month_partitions(conn, before):
+                await conn.execute(f'ALTER TABLE {table} DETACH PARTITION {name}')
+                detached.append(name)
+    return detached
+
+# ---------- Версии данных ----------
+
+# Таблица -> набор данных, версию которого меняет запись в неё
+DATA_VERSION_TABLES = {
+    'categories': 'inventory',
+    'items': 'inventory',
+    'clients': 'clients',
+    'purchases': 'clients',
+}
+
+@retry_on_db_error()
+async def get_data_version(name: str) -> int:
+    """Текущая версия набора данных ('inventory' или 'clients') – меняется при каждой записи."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchval('SELECT version FROM data_versions WHERE name = $1', name) or 0
 
 # ---------- Категории и товары ----------
 
+# Категории, товары которых не попадают в остатки
+STOCK_EXCLUDED_CATEGORIES = ('Б/У:', 'Б/У', 'NS:', 'NS')
+
+def _item_attribute_values(text: str) -> tuple:
+    attrs = get_item_attributes(text)
+    return (attrs['model_name'], attrs['base_name'], attrs['memory'],
+            attrs['sim_type'], attrs['watch_size'])
+
+def _item_values(text: str, serial: str | None, category_id: int) -> tuple:
+    """Значения колонок нового товара: характеристики вычисляются один раз при вставке."""
+    return (text, serial, category_id, 'Бронь от' in text, *_item_attribute_values(text))
+
+async def _insert_items(conn, items: list):
+    """
+    Вставляет товары [(text, serial, category_id), ...] одним запросом.
+    Возвращает строки для учёта остатков.
+    """
+    columns = list(zip(*(_item_values(*item) for item in items)))
+    return await conn.fetch('''
+        INSERT INTO items (text, serial, category_id, is_booked,
+                           model_name, base_name, memory, sim_type, watch_size)
+        SELECT * FROM unnest($1::text[], $2::text[], $3::int[], $4::bool[],
+                             $5::text[], $6::text[], $7::text[], $8::text[], $9::int[])
+        RETURNING model_name, sim_type, is_booked,
+                  (SELECT name FROM categories c WHERE c.id = category_id) AS category_name
+    ''', *columns)
+
+def _count_stock(deltas: Counter, rows, sign: int):
+    """Добавляет в deltas изменение остатков для строк товаров (бронь и Б/У/NS не учитываются)."""
+    for row in rows:
+        if not row['is_booked'] and row['category_name'] not in STOCK_EXCLUDED_CATEGORIES:
+            deltas[(row['model_name'], row['sim_type'])] += sign
+
+async def _apply_stock_deltas(conn, deltas: Counter):
+    """Применяет изменения остатков в текущей транзакции (ключи по порядку – без взаимных блокировок)."""
+    changes = sorted((key, delta) for key, delta in deltas.items() if delta)
+    if not changes:
+        return
+    await conn.executemany('''
+        INSERT INTO stock_levels (model_name, sim_type, count) VALUES ($1, $2, $3)
+        ON CONFLICT (model_name, sim_type) DO UPDATE SET count = stock_levels.count + EXCLUDED.count
+    ''', [(model_name, sim_type, delta) for (model_name, sim_type), delta in changes])
+
+async def _rebuild_stock_levels(conn):
+    """Полностью пересчитывает остатки (вызывать внутри транзакции)."""
+    await conn.execute('LOCK TABLE stock_levels IN EXCLUSIVE MODE')
+    await conn.execute('DELETE FROM stock_levels')
+    await conn.execute('''
+        INSERT INTO stock_levels (model_name, sim_type, count)
+        SELECT i.model_name, i.sim_type, COUNT(*)
+        FROM items i
+        JOIN categories c ON i.category_id = c.id
+        WHERE i.is_booked = false AND c.name <> ALL($1::text[])
+        GROUP BY i.model_name, i.sim_type
+    ''', list(STOCK_EXCLUDED_CATEGORIES))
+
 @retry_on_db_error()
-async def get_or_create_category(name: str) -> int:
-    norm_name = name.lower().rstrip(':')
+async def rebuild_stock_levels():
     pool = await get_pool()
     async with pool.acquire() as conn:
-        row = await conn.fetchrow('SELECT id FROM categories WHERE LOWER(name) = $1', norm_name)
-        if row:
-            return row['id']
-        row = await conn.fetchrow('INSERT INTO categories (name) VALUES ($1) RETURNING id', name)
+        async with conn.transaction():
+            await _rebuild_stock_levels(conn)
+
+async def _get_or_create_category(conn, name: str) -> int:
+    norm_name = name.lower().rstrip(':')
+    row = await conn.fetchrow('SELECT id FROM categories WHERE LOWER(name) = $1', norm_name)
+    if row:
         return row['id']
+    row = await conn.fetchrow('INSERT INTO categories (name) VALUES ($1) RETURNING id', name)
+    return row['id']
+
+@retry_on_db_error()
+async def get_or_create_category(name: str) -> int:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await _get_or_create_category(conn, name)
 
 @retry_on_db_error()
 async def add_item(text: str, serial: str = None, category_name: str = None):
     if category_name is None:
         category_name = "Общее:"
-    cat_id = await get_or_create_category(category_name)
     normalized_serial = serial.strip().upper() if serial else None
-    is_booked = 'Бронь от' in text
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute('''
-            INSERT INTO items (text, serial, category_id, is_booked)
-            VALUES ($1, $2, $3, $4)
-        ''', text, normalized_serial, cat_id, is_booked)
+        async with conn.transaction():
+            cat_id = await _get_or_create_category(conn, category_name)
+            rows = await _insert_items(conn, [(text, normalized_serial, cat_id)])
+            deltas = Counter()
+            _count_stock(deltas, rows, 1)
+            await _apply_stock_deltas(conn, deltas)
 
 @retry_on_db_error()
 async def get_item_id_by_serial(serial: str) -> int | None:
@@ -223,8 +844,17 @@ async def remove_item_by_serial(serial: str) -> int:
     normalized = serial.strip().upper() if serial else None
     pool = await get_pool()
     async with pool.acquire() as conn:
-        result = await conn.execute('DELETE FROM items WHERE UPPER(serial) = $1', normalized)
-        return int(result.split()[1]) if result.startswith('DELETE') else 0
+        async with conn.transaction():
+            rows = await conn.fetch('''
+                DELETE FROM items i
+                USING categories c
+                WHERE i.category_id = c.id AND UPPER(i.serial) = $1
+                RETURNING i.model_name, i.sim_type, i.is_booked, c.name AS category_name
+            ''', normalized)
+            deltas = Counter()
+            _count_stock(deltas, rows, -1)
+            await _apply_stock_deltas(conn, deltas)
+            return len(rows)
 
 @retry_on_db_error()
 async def get_all_categories_with_items():
@@ -246,117 +876,315 @@ async def get_all_categories_with_items():
         return [{"header": cat, "items": items} for cat, items in categories.items()]
 
 @retry_on_db_error()
-async def get_all_items_serials():
+async def find_existing_items(lines: list, serials: list) -> list:
+    """
+    Проверяет строки прибытия по текущему ассортименту одним запросом.
+    Для каждой строки возвращает пару (есть товар с таким текстом, есть товар с таким серийным номером).
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch('''
+            SELECT EXISTS (SELECT 1 FROM items i WHERE i.text = l.line) AS text_exists,
+                   EXISTS (SELECT 1 FROM items i WHERE i.serial = l.serial) AS serial_exists
+            FROM unnest($1::text[], $2::text[]) WITH ORDINALITY AS l(line, serial, idx)
+            ORDER BY l.idx
+        ''', lines, serials)
+        return [(row['text_exists'], row['serial_exists']) for row in rows]
+
+@retry_on_db_error()
+async def get_items_with_categories():
     pool = await get_pool()
     async with pool.acquire() as conn:
-        rows = await conn.fetch('SELECT text, serial FROM items')
+        rows = await conn.fetch('''
+            SELECT i.id, i.text, i.serial, c.name as category_name
+            FROM items i
+            JOIN categories c ON i.category_id = c.id
+            ORDER BY i.id
+        ''')
         return [dict(row) for row in rows]
 
-async def update_category_items(category_name: str, new_items: list):
-    from serial_utils import extract_serial
-    cat_id = await get_or_create_category(category_name)
+@retry_on_db_error()
+async def apply_inventory_diff(diff: dict):
+    """
+    Применяет разницу ассортимента одной транзакцией:
+    удаляет, переносит и добавляет только изменившиеся товары.
+    """
     pool = await get_pool()
     async with pool.acquire() as conn:
         async with conn.transaction():
-            await conn.execute('DELETE FROM items WHERE category_id = $1', cat_id)
-            for item_text in new_items:
-                serial = extract_serial(item_text)
-                if serial:
-                    serial = serial.strip().upper()
-                is_booked = 'Бронь от' in item_text
-                await conn.execute('''
-                    INSERT INTO items (text, serial, category_id, is_booked)
-                    VALUES ($1, $2, $3, $4)
-                ''', item_text, serial, cat_id, is_booked)
+            cat_ids = {}
+            for name in diff['categories']:
+                cat_ids[name] = await _get_or_create_category(conn, name)
+            deltas = Counter()
+            if diff['delete']:
+                rows = await conn.fetch('''
+                    DELETE FROM items i
+                    USING categories c
+                    WHERE i.category_id = c.id AND i.id = ANY($1::int[])
+                    RETURNING i.model_name, i.sim_type, i.is_booked, c.name AS category_name
+                ''', diff['delete'])
+                _count_stock(deltas, rows, -1)
+            if diff['move']:
+                item_ids = [item_id for item_id, _ in diff['move']]
+                rows = await conn.fetch('''
+                    SELECT i.model_name, i.sim_type, i.is_booked, c.name AS category_name
+                    FROM items i
+                    JOIN categories c ON i.category_id = c.id
+                    WHERE i.id = ANY($1::int[])
+                    FOR UPDATE OF i
+                ''', item_ids)
+                _count_stock(deltas, rows, -1)
+                rows = await conn.fetch('''
+                    UPDATE items i SET category_id = m.category_id
+                    FROM unnest($1::int[], $2::int[]) AS m(id, category_id)
+                    JOIN categories c ON c.id = m.category_id
+                    WHERE i.id = m.id
+                    RETURNING i.model_name, i.sim_type, i.is_booked, c.name AS category_name
+                ''', item_ids, [cat_ids[name] for _, name in diff['move']])
+                _count_stock(deltas, rows, 1)
+            if diff['insert']:
+                rows = await _insert_items(conn, [
+                    (text, serial, cat_ids[name]) for text, serial, name in diff['insert']
+                ])
+                _count_stock(deltas, rows, 1)
+            await _apply_stock_deltas(conn, deltas)
+
+@retry_on_db_error()
+async def get_remains():
+    """Количество товаров в наличии по (модель, тип SIM), без брони и категорий Б/У и NS."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            'SELECT model_name, sim_type, count FROM stock_levels WHERE count > 0'
+        )
+        return [dict(row) for row in rows]
+
+@retry_on_db_error()
+async def merge_categories(from_id: int, to_id: int):
+    """Переносит товары из категории from_id в to_id и удаляет from_id."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            deltas = Counter()
+            rows = await conn.fetch('''
+                SELECT i.model_name, i.sim_type, i.is_booked, c.name AS category_name
+                FROM items i
+                JOIN categories c ON i.category_id = c.id
+                WHERE i.category_id = $1
+                FOR UPDATE OF i
+            ''', from_id)
+            _count_stock(deltas, rows, -1)
+            rows = await conn.fetch('''
+                UPDATE items SET category_id = $1
+                WHERE category_id = $2
+                RETURNING model_name, sim_type, is_booked,
+                          (SELECT name FROM categories c WHERE c.id = category_id) AS category_name
+            ''', to_id, from_id)
+            _count_stock(deltas, rows, 1)
+            await _apply_stock_deltas(conn, deltas)
+            await conn.execute('DELETE FROM categories WHERE id = $1', from_id)
 
 @retry_on_db_error()
 async def clear_all_inventory():
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute('DELETE FROM categories')
+        async with conn.transaction():
+            await conn.execute('DELETE FROM categories')
+            await conn.execute('DELETE FROM stock_levels')
 
 # ---------- Статистика ----------
 
+DAILY_SUMMARY_COUNTERS = (
+    'sales', 'sales_cash', 'sales_terminal', 'sales_qr', 'sales_installment',
+    'preorders', 'preorders_cash', 'preorders_terminal', 'preorders_qr', 'preorders_installment',
+    'bookings', 'bookings_total',
+)
+# вместе с вычисляемыми колонками
+DAILY_SUMMARY_COLUMNS = DAILY_SUMMARY_COUNTERS + ('terminal', 'cash', 'qr', 'installment', 'total')
+
+def _current_epoch(day: str) -> str:
+    """Итоги пишутся в последнюю эпоху дня (эпохи 1, 2, ... появляются при сбросе статистики)."""
+    return f'(SELECT COALESCE(MAX(epoch), 0) FROM daily_summary WHERE day = {day})'
+
+async def _rebuild_daily_summary(conn):
+    """
+    Пересчитывает итоги по дням из продаж, предзаказов и броней (вызывать внутри транзакции).
+    Отметки сбросов сохраняются: каждая запись попадает в эпоху, начавшуюся до неё.
+    Дни отсоединённых секций (archive_partitions) не трогаются – их данных в таблицах уже нет.
+    """
+    since = await _attached_since(conn) or date.min
+    await conn.execute('LOCK TABLE daily_summary IN EXCLUSIVE MODE')
+    await conn.execute('''
+        CREATE TEMP TABLE daily_resets ON COMMIT DROP AS
+        SELECT day, epoch, reset_at FROM daily_summary WHERE epoch > 0 AND day >= $1
+    ''', since)
+    await conn.execute('DELETE FROM daily_summary WHERE day >= $1', since)
+    await conn.execute('INSERT INTO daily_summary (day, epoch, reset_at) SELECT * FROM daily_resets')
+    counters = ', '.join(DAILY_SUMMARY_COUNTERS)
+    await conn.execute(f'''
+        INSERT INTO daily_summary (day, epoch, {counters})
+        SELECT day, epoch, {', '.join(f'COALESCE(SUM({column}), 0)' for column in DAILY_SUMMARY_COUNTERS)}
+        FROM (
+            SELECT t.*, (SELECT COUNT(*) FROM daily_resets r
+                         WHERE r.day = t.day AND r.reset_at <= t.at) AS epoch
+            FROM (
+                SELECT DATE(sold_at) AS day, sold_at AS at,
+                       CASE WHEN is_accessory THEN 0 ELSE 1 END AS sales,
+                       cash AS sales_cash, terminal AS sales_terminal,
+                       qr AS sales_qr, installment AS sales_installment,
+                       0 AS preorders, 0 AS preorders_cash, 0 AS preorders_terminal,
+                       0 AS preorders_qr, 0 AS preorders_installment, 0 AS bookings, 0 AS bookings_total
+                FROM sales WHERE sold_at >= $1::date
+                UNION ALL
+                SELECT DATE(created_at), created_at, 0, 0, 0, 0, 0, 1, cash, terminal, qr, installment, 0, 0
+                FROM preorders WHERE created_at >= $1::date
+                UNION ALL
+                SELECT DATE(booked_at), booked_at, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, total_amount
+                FROM bookings WHERE booked_at >= $1::date
+            ) t
+        ) e
+        GROUP BY day, epoch
+        ON CONFLICT (day, epoch) DO UPDATE SET
+            {', '.join(f'{column} = EXCLUDED.{column}' for column in DAILY_SUMMARY_COUNTERS)}
+    ''', since)
+
+@retry_on_db_error()
+async def rebuild_daily_summary():
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await _rebuild_daily_summary(conn)
+
 @retry_on_db_error()
 async def add_sale(item_id: int = None, count: int = 1,
                    cash: float = 0, terminal: float = 0, qr: float = 0, installment: float = 0,
                    is_accessory: bool = False):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute('''
-            INSERT INTO sales (item_id, count, cash, terminal, qr, installment, is_accessory)
-            VALUES ($1, $2, $3, $4, $5, $6, $7)
+        # Продажа и итог дня пишутся одним запросом
+        await conn.execute(f'''
+            WITH s AS (
+                INSERT INTO sales (item_id, count, cash, terminal, qr, installment, is_accessory)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
+                RETURNING sold_at, cash, terminal, qr, installment, is_accessory
+            )
+            INSERT INTO daily_summary (day, epoch, sales, sales_cash, sales_terminal, sales_qr, sales_installment)
+            SELECT DATE(sold_at), {_current_epoch('DATE(sold_at)')},
+                   CASE WHEN is_accessory THEN 0 ELSE 1 END, cash, terminal, qr, installment
+            FROM s
+            ON CONFLICT (day, epoch) DO UPDATE SET
+                sales = daily_summary.sales + EXCLUDED.sales,
+                sales_cash = daily_summary.sales_cash + EXCLUDED.sales_cash,
+                sales_terminal = daily_summary.sales_terminal + EXCLUDED.sales_terminal,
+                sales_qr = daily_summary.sales_qr + EXCLUDED.sales_qr,
+                sales_installment = daily_summary.sales_installment + EXCLUDED.sales_installment
         ''', item_id, count, cash, terminal, qr, installment, is_accessory)
 
 @retry_on_db_error()
 async def add_preorder(cash=0, terminal=0, qr=0, installment=0):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute('''
-            INSERT INTO preorders (cash, terminal, qr, installment)
-            VALUES ($1, $2, $3, $4)
+        await conn.execute(f'''
+            WITH p AS (
+                INSERT INTO preorders (cash, terminal, qr, installment)
+                VALUES ($1, $2, $3, $4)
+                RETURNING created_at, cash, terminal, qr, installment
+            )
+            INSERT INTO daily_summary (day, epoch, preorders, preorders_cash, preorders_terminal,
+                                       preorders_qr, preorders_installment)
+            SELECT DATE(created_at), {_current_epoch('DATE(created_at)')}, 1, cash, terminal, qr, installment
+            FROM p
+            ON CONFLICT (day, epoch) DO UPDATE SET
+                preorders = daily_summary.preorders + 1,
+                preorders_cash = daily_summary.preorders_cash + EXCLUDED.preorders_cash,
+                preorders_terminal = daily_summary.preorders_terminal + EXCLUDED.preorders_terminal,
+                preorders_qr = daily_summary.preorders_qr + EXCLUDED.preorders_qr,
+                preorders_installment = daily_summary.preorders_installment + EXCLUDED.preorders_installment
         ''', cash, terminal, qr, installment)
 
 @retry_on_db_error()
 async def add_booking(item_id: int, total_amount: float):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        await conn.execute('''
-            INSERT INTO bookings (item_id, total_amount) VALUES ($1, $2)
+        await conn.execute(f'''
+            WITH b AS (
+                INSERT INTO bookings (item_id, total_amount) VALUES ($1, $2)
+                RETURNING booked_at, total_amount
+            )
+            INSERT INTO daily_summary (day, epoch, bookings, bookings_total)
+            SELECT DATE(booked_at), {_current_epoch('DATE(booked_at)')}, 1, total_amount
+            FROM b
+            ON CONFLICT (day, epoch) DO UPDATE SET
+                bookings = daily_summary.bookings + 1,
+                bookings_total = daily_summary.bookings_total + EXCLUDED.bookings_total
         ''', item_id, total_amount)
 
 @retry_on_db_error()
-async def get_today_stats():
-    today = date.today()
+async def reset_day_stats(day: date):
+    """
+    Сбрасывает статистику дня: добавляет пустую строку новой эпохи, дальше итоги копятся в ней.
+    Продажи, предзаказы и брони остаются в таблицах.
+    """
     pool = await get_pool()
     async with pool.acquire() as conn:
-        sale_count = await conn.fetchval('''
-            SELECT COUNT(*) FROM sales WHERE DATE(sold_at) = $1 AND is_accessory = false
-        ''', today) or 0
-
-        sale_sums = await conn.fetchrow('''
-            SELECT COALESCE(SUM(cash),0), COALESCE(SUM(terminal),0),
-                   COALESCE(SUM(qr),0), COALESCE(SUM(installment),0)
-            FROM sales WHERE DATE(sold_at) = $1
-        ''', today)
-        sc, st, sq, si = sale_sums
-
-        pre = await conn.fetchrow('''
-            SELECT COUNT(*), COALESCE(SUM(cash),0), COALESCE(SUM(terminal),0),
-                   COALESCE(SUM(qr),0), COALESCE(SUM(installment),0)
-            FROM preorders WHERE DATE(created_at) = $1
-        ''', today)
-        pre_count, pc, pt, pq, pi = pre
+        await conn.execute('''
+            INSERT INTO daily_summary (day, epoch, reset_at)
+            SELECT $1, COALESCE(MAX(epoch), 0) + 1, CURRENT_TIMESTAMP FROM daily_summary WHERE day = $1
+            ON CONFLICT (day, epoch) DO NOTHING
+        ''', day)
 
-        book = await conn.fetchrow('''
-            SELECT COUNT(*), COALESCE(SUM(total_amount),0)
-            FROM bookings WHERE DATE(booked_at) = $1
-        ''', today)
-        book_count, book_total = book
+@retry_on_db_error()
+async def get_daily_summary(date_from: date, date_to: date):
+    """Итоги по дням за период (включительно, все эпохи), дни без записей пропускаются."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        sums = ', '.join(f'SUM({column}) AS {column}' for column in DAILY_SUMMARY_COLUMNS)
+        rows = await conn.fetch(
+            f'SELECT day, {sums} FROM daily_summary WHERE day BETWEEN $1 AND $2 GROUP BY day ORDER BY day',
+            date_from, date_to
+        )
+        return [dict(row) for row in rows]
 
+@retry_on_db_error()
+async def get_range_stats(date_from: date, date_to: date):
+    """
+    Суммарная статистика за период (включительно) – в формате get_today_stats.
+    Учитываются все записи, в том числе сделанные до сбросов статистики.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        sums = ', '.join(f'COALESCE(SUM({column}), 0) AS {column}' for column in DAILY_SUMMARY_COLUMNS)
+        row = await conn.fetchrow(
+            f'SELECT {sums} FROM daily_summary WHERE day BETWEEN $1 AND $2',
+            date_from, date_to
+        )
         return {
-            'date': today.strftime('%Y-%m-%d'),
-            'preorders': pre_count,
-            'bookings': book_count,
-            'sales': sale_count,
-            'preorders_cash': pc,
-            'preorders_terminal': pt,
-            'preorders_qr': pq,
-            'preorders_installment': pi,
-            'bookings_total': book_total,
-            'sales_cash': sc,
-            'sales_terminal': st,
-            'sales_qr': sq,
-            'sales_installment': si,
+            'date_from': date_from.strftime('%Y-%m-%d'),
+            'date_to': date_to.strftime('%Y-%m-%d'),
+            **dict(row),
         }
 
+@retry_on_db_error()
+async def get_today_stats():
+    """Статистика за сегодня после последнего сброса – одна строка daily_summary."""
+    today = date.today()
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            'SELECT * FROM daily_summary WHERE day = $1 ORDER BY epoch DESC LIMIT 1', today
+        )
+    stats = dict.fromkeys(DAILY_SUMMARY_COLUMNS, 0)
+    if row:
+        stats.update({column: row[column] for column in DAILY_SUMMARY_COLUMNS})
+    return {'date': today.strftime('%Y-%m-%d'), **stats}
+
 # ---------- Клиенты и покупки ----------
 
 @retry_on_db_error()
 async def get_or_create_client(phone: str = None, phones: list = None, full_name: str = None,
                                telegram_username: str = None, social_network: str = None,
                                referral_source: str = None) -> int:
-    logger.info(f"🔍 get_or_create_client: phone={phone}, phones={phones}, full_name={full_name}")
+    logger.debug("🔍 get_or_create_client: phone=%s, phones=%s, full_name=%s", phone, phones, full_name)
     pool = await get_pool()
     async with pool.acquire() as conn:
         if phone:
@@ -390,7 +1218,7 @@ async def get_or_create_client(phone: str = None, phones: list = None, full_name
                     params.append(client_id)
                     query = f"UPDATE clients SET {set_clause}, updated_at = CURRENT_TIMESTAMP WHERE id = ${len(params)}"
                     await conn.execute(query, *params)
-                    logger.info(f"✅ Клиент {client_id} обновлён")
+                    logger.info("✅ Клиент %s обновлён", client_id)
                 return client_id
             else:
                 phones_str = ",".join(sorted(set(phones))) if phones else None
@@ -407,16 +1235,35 @@ async def get_or_create_client(phone: str = None, phones: list = None, full_name
             ''', full_name, phones_str, telegram_username, social_network, referral_source)
             return row['id']
 
+def _purchase_items(items: list) -> list:
+    """Добавляет к товарам покупки модель в нижнем регистре – ключ поиска для GIN-индекса."""
+    return [{**item, 'model': get_full_model_name(item.get('item_text') or '').lower()} if isinstance(item, dict) else item
+            for item in items]
+
 @retry_on_db_error()
 async def add_purchase(client_id: int, items: list, total_amount: float, payment_details: dict, purchase_type: str = 'sale'):
-    items_json = json.dumps(items, ensure_ascii=False)
-    payment_json = json.dumps(payment_details, ensure_ascii=False)
     pool = await get_pool()
     async with pool.acquire() as conn:
         await conn.execute('''
             INSERT INTO purchases (client_id, items_json, total_amount, payment_details, purchase_type)
             VALUES ($1, $2, $3, $4, $5)
-        ''', client_id, items_json, total_amount, payment_json, purchase_type)
+        ''', client_id, _purchase_items(items), total_amount, payment_details, purchase_type)
+
+@retry_on_db_error()
+async def get_clients_by_model(model_name: str):
+    """Клиенты, покупавшие модель (полное название без серийника, регистр не важен)."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch('''
+            SELECT c.id, c.full_name, c.phone, c.telegram_username,
+                   COUNT(*) AS purchase_count, MAX(p.created_at) AS last_purchase
+            FROM purchases p
+            JOIN clients c ON c.id = p.client_id
+            WHERE p.items_json @> jsonb_build_array(jsonb_build_object('model', $1::text))
+            GROUP BY c.id
+            ORDER BY last_purchase DESC
+        ''', get_full_model_name(model_name).lower())
+        return [dict(row) for row in rows]
 
 @retry_on_db_error()
 async def get_client_purchases(client_id: int):
@@ -436,6 +1283,41 @@ async def search_clients(query: str):
         ''', f'%{query}%')
         return [dict(row) for row in rows]
 
+@retry_on_db_error()
+async def get_client_dossiers(query: str):
+    """
+    Клиенты, найденные как в search_clients, вместе с покупками – одним запросом.
+    Итоги (purchase_count, lifetime_spend, last_purchase) считаются в БД,
+    покупки приходят списком purchases (новые сверху).
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch('''
+            SELECT c.*,
+                   COALESCE(s.purchase_count, 0) AS purchase_count,
+                   COALESCE(s.lifetime_spend, 0) AS lifetime_spend,
+                   s.last_purchase,
+                   COALESCE(s.purchases, '[]'::jsonb) AS purchases
+            FROM clients c
+            LEFT JOIN LATERAL (
+                SELECT COUNT(*) AS purchase_count,
+                       SUM(p.total_amount) AS lifetime_spend,
+                       MAX(p.created_at) AS last_purchase,
+                       jsonb_agg(jsonb_build_object(
+                           'created_at', to_char(p.created_at, 'YYYY-MM-DD HH24:MI:SS'),
+                           'items', p.items_json,
+                           'total_amount', p.total_amount,
+                           'payment_details', p.payment_details,
+                           'purchase_type', p.purchase_type
+                       ) ORDER BY p.created_at DESC) AS purchases
+                FROM purchases p
+                WHERE p.client_id = c.id
+            ) s ON TRUE
+            WHERE c.full_name ILIKE $1 OR c.phone ILIKE $1 OR c.telegram_username ILIKE $1
+            ORDER BY c.updated_at DESC
+        ''', f'%{query}%')
+        return [dict(row) for row in rows]
+
 # ---------- Функции для работы по месяцам ----------
 
 @retry_on_db_error()
@@ -477,9 +1359,12 @@ async def get_clients_data_for_month(month_str: str):
                 c.referral_source,
                 c.created_at as client_created_at,
                 p.id as purchase_id,
-                p.items_json,
+                CASE WHEN jsonb_typeof(p.items_json) = 'array' THEN
+                    (SELECT string_agg(left(it->>'item_text', 50) || ' (' || coalesce(it->>'price', '') || '₽)', '; ')
+                     FROM jsonb_array_elements(p.items_json) it)
+                ELSE p.items_json #>> '{}' END as items_text,
                 p.total_amount,
-                p.payment_details,
+                p.payment_details::text as payment_details,
                 p.purchase_type,
                 p.created_at as purchase_created_at
             FROM clients c
@@ -489,3 +1374,34 @@ async def get_clients_data_for_month(month_str: str):
             ORDER BY c.id, p.created_at
         ''', start_date, end_date)
         return [dict(row) for row in rows]
+
+# ---------- Кеш отчётов за закрытые месяцы ----------
+
+@retry_on_db_error()
+async def get_month_report(month_str: str) -> dict | None:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow('SELECT csv, file_id FROM month_reports WHERE month = $1', month_str)
+        return dict(row) if row else None
+
+@retry_on_db_error()
+async def save_month_report(month_str: str, csv_data: bytes, version: int):
+    """
+    Сохраняет отчёт, построенный при версии month_reports = version. Если за время
+    построения клиенты или покупки изменились (версия выросла), отчёт не сохраняется.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute('''
+            INSERT INTO month_reports (month, csv)
+            SELECT $1, $2
+            WHERE COALESCE((SELECT version FROM data_versions WHERE name = 'month_reports'), 0) = $3
+            ON CONFLICT (month) DO UPDATE SET csv = EXCLUDED.csv, file_id = NULL,
+                                              created_at = CURRENT_TIMESTAMP
+        ''', month_str, csv_data, version)
+
+@retry_on_db_error()
+async def set_month_report_file_id(month_str: str, file_id: str):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute('UPDATE month_reports SET file_id = $2 WHERE month = $1', month_str, file_id)
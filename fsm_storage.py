@@ -0,0 +1,177 @@
+import os
+import json
+import zlib
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Mapping
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+import metrics
+from database import get_pool
+
+logger = logging.getLogger(__name__)
+
+FSM_CACHE_SIZE = int(os.environ.get('FSM_CACHE_SIZE', 1000))
+# Данные длиннее порога сжимаются (временный ассортимент может занимать мегабайты)
+COMPRESS_THRESHOLD = 1024
+# Данные с коллекциями или строками длиннее этого сериализуются в отдельном потоке
+INLINE_ENCODE_LIMIT = 100
+
+def encode_data(data: dict) -> bytes:
+    raw = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(raw) > COMPRESS_THRESHOLD:
+        return b'z' + zlib.compress(raw, 1)
+    return b'j' + raw
+
+def decode_data(blob: bytes | None) -> dict:
+    if not blob:
+        return {}
+    raw = zlib.decompress(blob[1:]) if blob[:1] == b'z' else blob[1:]
+    return json.loads(raw)
+
+def _is_large(data: dict) -> bool:
+    return any(isinstance(value, (list, dict, str)) and len(value) > INLINE_ENCODE_LIMIT for value in data.values())
+
+async def _encode(data: dict) -> bytes:
+    # Обычные состояния кодируются сразу; крупные (временный ассортимент) – в потоке,
+    # не занимая пул отчётов: сохранение FSM не должно ждать построения отчётов
+    if _is_large(data):
+        return await asyncio.to_thread(encode_data, data)
+    return encode_data(data)
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM-хранилище в таблице fsm_storage, переживает перезапуски и может быть общим
+    для нескольких процессов бота.
+    Каждое чтение сверяет версию строки с LRU-кешем: данные (временный ассортимент
+    может занимать мегабайты) передаются и разбираются, только если их изменили.
+    Записи за обновление копятся в памяти и сохраняются одним запросом в flush(),
+    который вызывается до ответа на вебхук и при закрытии.
+    Данные должны сериализоваться в JSON.
+    """
+
+    def __init__(self, cache_size: int = FSM_CACHE_SIZE, key_builder: KeyBuilder | None = None):
+        self.cache_size = cache_size
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        # Ключ -> (версия строки в БД: None – строки нет, 0 – ещё не сохранена; состояние; данные)
+        self._cache: OrderedDict[str, tuple[int | None, str | None, dict]] = OrderedDict()
+        self._pending: dict[str, tuple[str | None, dict]] = {}
+        self._flushing: dict[str, tuple[str | None, dict]] = {}
+        self._flush_lock = asyncio.Lock()
+
+    async def _load(self, key: StorageKey) -> tuple[str | None, dict]:
+        name = self.key_builder.build(key)
+        # Несохранённые изменения этого процесса новее БД
+        for unsaved in (self._pending, self._flushing):
+            if name in unsaved:
+                return unsaved[name]
+        cached = self._cache.get(name)
+        version = cached[0] if cached else 0
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow('''
+                SELECT version, state, CASE WHEN version = $2 THEN NULL ELSE data END AS data
+                FROM fsm_storage WHERE key = $1
+            ''', name, version or 0)
+        if row is None:
+            hit = bool(cached) and version is None
+            version, state, data = None, None, {}
+        elif row['version'] == version:
+            hit = True
+            state, data = cached[1], cached[2]
+        else:
+            hit = False
+            version, state, data = row['version'], row['state'], decode_data(row['data'])
+        metrics.cache_hit('fsm', hit)
+        self._remember(name, version, state, data)
+        return state, data
+
+    def _remember(self, name: str, version: int | None, state: str | None, data: dict):
+        self._cache[name] = (version, state, data)
+        self._cache.move_to_end(name)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _saved(self, name: str, version: int | None):
+        """Запоминает версию сохранённой записи, если её не успели изменить снова."""
+        cached = self._cache.get(name)
+        if cached and name not in self._pending:
+            self._cache[name] = (version, cached[1], cached[2])
+
+    async def _store(self, key: StorageKey, state: str | None, data: dict):
+        name = self.key_builder.build(key)
+        self._pending[name] = (state, data)
+        self._remember(name, 0, state, data)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data = await self._load(key)
+        await self._store(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state, _ = await self._load(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        state, _ = await self._load(key)
+        await self._store(key, state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data = await self._load(key)
+        return data.copy()
+
+    @property
+    def pending(self) -> int:
+        """Число ключей с несохранёнными изменениями."""
+        return len(self._pending)
+
+    async def flush(self):
+        """
+        Сохраняет все накопленные изменения: пустые записи удаляются, остальные – одним upsert.
+        Одновременные вызовы ждут друг друга, так что после возврата сохранены и изменения,
+        которые забрал в свою пачку другой вызов. При ошибке изменения остаются до следующего flush().
+        """
+        async with self._flush_lock:
+            while self._pending:
+                batch, self._pending = self._pending, {}
+                self._flushing = batch
+                upserts = [(name, state, data) for name, (state, data) in batch.items() if state is not None or data]
+                deletes = [name for name, (state, data) in batch.items() if state is None and not data]
+                try:
+                    encoded = [await _encode(data) for _, _, data in upserts]
+                    pool = await get_pool()
+                    async with pool.acquire() as conn:
+                        async with conn.transaction():
+                            saved = await conn.fetch('''
+                                INSERT INTO fsm_storage (key, state, data, updated_at)
+                                SELECT key, state, data, CURRENT_TIMESTAMP
+                                FROM unnest($1::text[], $2::text[], $3::bytea[]) AS u(key, state, data)
+                                ON CONFLICT (key) DO UPDATE SET state = EXCLUDED.state, data = EXCLUDED.data,
+                                                                updated_at = EXCLUDED.updated_at,
+                                                                version = nextval('fsm_storage_version')
+                                RETURNING key, version
+                            ''', [name for name, _, _ in upserts], [state for _, state, _ in upserts],
+                                encoded) if upserts else []
+                            if deletes:
+                                await conn.execute('DELETE FROM fsm_storage WHERE key = ANY($1::text[])', deletes)
+                except Exception:
+                    # Более новые изменения тех же ключей важнее неудавшихся
+                    for name, value in batch.items():
+                        self._pending.setdefault(name, value)
+                    logger.exception("Не удалось сохранить состояние FSM")
+                    return
+                finally:
+                    self._flushing = {}
+                for row in saved:
+                    self._saved(row['key'], row['version'])
+                for name in deletes:
+                    self._saved(name, None)
+
+    async def close(self) -> None:
+        await self.flush()
@@ -1,46 +1,115 @@
 import re
-import tempfile
-import os
-import aiofiles
 import logging
 from datetime import datetime
 from aiogram import Router, F, Bot
-from aiogram.types import Message, FSInputFile, Document, CallbackQuery, ReactionTypeEmoji
+from aiogram.types import Message, BufferedInputFile, Document, CallbackQuery, ReactionTypeEmoji
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 
 import config
-import inventory
 import stats
-from sort_assortment import sort_assortment_to_categories, build_output_text
+from sort_assortment import sort_assortment_to_categories
+from database import get_all_categories_with_items
+from workers import run_report
 
 logger = logging.getLogger(__name__)
 
 router = Router()
 
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+def _telegram_length(text: str) -> int:
+    """Длина текста так, как её считает Telegram (в UTF-16, эмодзи – два символа)."""
+    return len(text.encode('utf-16-le')) // 2
+
+def paginate(blocks: list[str], limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    """
+    Собирает блоки текста в страницы не длиннее limit символов.
+    Блоки не разрываются между страницами; слишком длинный блок делится по строкам.
+    """
+    pages = []
+    page, page_length = '', 0
+    for block in blocks:
+        if _telegram_length(block) > limit:
+            pieces = []
+            for line in block.splitlines(keepends=True):
+                # limit // 2 кодовых точек гарантированно укладываются в limit
+                pieces.extend(line[i:i + limit // 2] for i in range(0, len(line), limit // 2))
+        else:
+            pieces = [block]
+        for piece in pieces:
+            length = _telegram_length(piece)
+            if page_length + length > limit:
+                pages.append(page)
+                page, page_length = '', 0
+            page += piece
+            page_length += length
+    if page:
+        pages.append(page)
+    return pages
+
+class ReplyBatch:
+    """
+    Собирает ответы на одно сообщение и отправляет их одним (при необходимости
+    постранично), а из нескольких реакций ставит только последнюю –
+    так обработка длинного блока не упирается в лимиты Telegram на чат.
+
+        async with ReplyBatch(message) as replies:
+            replies.reply("...")
+            replies.react("👍")
+    """
+
+    def __init__(self, message: Message):
+        self.message = message
+        self.replies: list[str] = []
+        self.reaction: str | None = None
+
+    def reply(self, text: str):
+        self.replies.append(text)
+
+    def react(self, emoji: str):
+        self.reaction = emoji
+
+    async def flush(self):
+        replies, self.replies = self.replies, []
+        reaction, self.reaction = self.reaction, None
+        if reaction:
+            await self.message.react([ReactionTypeEmoji(emoji=reaction)])
+        for page in paginate([text + "\n\n" for text in replies]):
+            await self.message.reply(page.rstrip())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        # Уже собранные ответы отправляются и при ошибке в обработчике
+        await self.flush()
+
+async def build_inventory_report() -> tuple[bytes, str] | None:
+    """Формирует файл ассортимента и подпись к нему; None, если ассортимент пуст."""
+    # Читаем из БД, а не из кеша inventory: отчёт запоминается под текущей версией данных,
+    # а кеш после продаж и прибытий может отставать на CACHE_TTL
+    categories = await get_all_categories_with_items()
+    if not categories:
+        return None
+    # Модуль отчётов загружается при первой выгрузке, а не при старте бота
+    from reports import build_assortment_file
+    data = await run_report(build_assortment_file, categories, heavy=True)
+    return data, f"📦 Текущий ассортимент (категорий: {len(categories)})"
+
 async def show_inventory(bot: Bot, chat_id: int) -> Message | None:
     """
     Отправляет файл с текущим ассортиментом в указанный чат.
     Возвращает отправленное сообщение или None.
     """
-    categories = await inventory.load_inventory()
-    if not categories:
+    report = await build_inventory_report()
+    if not report:
         return await bot.send_message(chat_id, "📭 Ассортимент пуст.")
-    text = build_output_text(categories)
-    with tempfile.NamedTemporaryFile(mode="w", suffix=".txt", delete=False, encoding="utf-8") as f:
-        f.write(text)
-        tmp_path = f.name
-    try:
-        document = FSInputFile(tmp_path, filename="assortiment.txt")
-        msg = await bot.send_document(
-            chat_id,
-            document,
-            caption=f"📦 Текущий ассортимент (категорий: {len(categories)})"
-        )
-        return msg
-    finally:
-        os.unlink(tmp_path)
+    data, caption = report
+    document = BufferedInputFile(data, filename="assortiment.txt")
+    msg = await bot.send_document(chat_id, document, caption=caption)
+    return msg
 
 async def show_help(bot: Bot, chat_id: int):
     """Отправляет справочное сообщение со списком команд."""
@@ -50,6 +119,7 @@ async def show_help(bot: Bot, chat_id: int):
 **Основные команды:**
 • /start – показать главное меню
 • /inventory – выгрузить файл с ассортиментом
+• /stats [с] [по] – статистика и финансы за день или период (ДД.ММ.ГГГГ)
 • /cancel – отменить текущее действие
 • /help – эта справка
 
@@ -57,7 +127,9 @@ async def show_help(bot: Bot, chat_id: int):
 • /export_clients – выгрузить всех клиентов в CSV
 • /export_purchases – выгрузить все покупки в CSV
 • /export_full_report – полный отчёт (клиенты + покупки)
+  (добавьте `gz` после команды экспорта, чтобы получить сжатый файл)
 • /client_info <телефон/имя> – информация о клиенте
+• /bought <модель> – клиенты, покупавшие модель
 
 **Управление категориями (админ):**
 • /show_categories – список категорий с ID
@@ -70,6 +142,7 @@ async def show_help(bot: Bot, chat_id: int):
 • /delete_client <ID> – удалить клиента и его покупки
 • /delete_purchase <ID> – удалить конкретную покупку
 • /migrate – выполнить миграцию БД (однократно)
+• /archive_partitions ММ.ГГГГ – отсоединить продажи и покупки за месяцы раньше указанного
 
 **Кнопки в меню:**
 • «Показать ассортимент» – аналог /inventory
@@ -112,7 +185,10 @@ def get_main_menu_keyboard():
 
 __all__ = [
     'router',
+    'paginate',
+    'ReplyBatch',
     'show_inventory',
+    'build_inventory_report',
     'show_help',
     'cancel_action',
     'get_main_menu_keyboard'
@@ -4,95 +4,134 @@ from aiogram.exceptions import TelegramBadRequest
 
 import config
 import inventory
+import metrics
 import stats
 from .base import (
-    router, logger, show_inventory, show_help, cancel_action, get_main_menu_keyboard
+    router, logger, build_inventory_report, show_help, cancel_action, get_main_menu_keyboard
 )
 from .topics.common import export_assortment_to_topic
-from database import get_available_months, get_clients_data_for_month
-from sort_assortment import extract_base_name, detect_sim_type, get_full_model_name
-import json
-import csv
-import tempfile
-import os
+from database import (
+    get_available_months, get_clients_data_for_month, get_remains, merge_categories, get_data_version,
+    get_month_report, save_month_report, set_month_report_file_id, archive_partitions
+)
+from workers import run_report
+from message_registry import messages
+import asyncio
 import asyncpg
+from collections import OrderedDict
 from datetime import datetime
-from aiogram.types import FSInputFile
+from aiogram.types import BufferedInputFile
 
 # ... (весь остальной код callbacks.py без изменений, кроме удалённого импорта состояний)
 
-last_stats_message = {}
-last_finance_message = {}
-last_inventory_message = {}
-last_remains_message = {}
-last_clients_month_message = {}
+def stats_text(s: dict) -> str:
+    return (
+        f"📊 Статистика за {s['date']}:\n"
+        f"• Предзаказов: {s['preorders']}\n"
+        f"• Броней: {s['bookings']}\n"
+        f"• Продаж: {s['sales']}"
+    )
+
+def finance_text(s: dict) -> str:
+    # Суммы по способам оплаты и итог уже посчитаны в строке дня
+    return (
+        f"💰 Финансы за {s['date']}:\n"
+        f"Терминал: {s['terminal']:.0f} руб.\n"
+        f"Наличные: {s['cash']:.0f} руб.\n"
+        f"QR-код: {s['qr']:.0f} руб.\n"
+        f"Рассрочка: {s['installment']:.0f} руб.\n"
+        f"ИТОГО: {s['total']:.0f} руб."
+    )
+
+# ---------- Общие отчёты для одновременных запросов ----------
+_report_flights = {}   # (отчёт, версия данных) -> задача построения и загрузки
+_report_files = OrderedDict()  # отчёт -> (версия данных, file_id, подпись)
+REPORT_FILES_LIMIT = 100  # отчёты за месяцы накапливаются – храним только недавние
+
+async def send_shared_report(name: str, version, build, send, filename: str):
+    """
+    Отправляет отчёт name, построенный для данной версии данных.
+    Одновременные запросы с той же версией ждут одного вызова build()
+    (возвращает (bytes, подпись) или None, если данных нет): файл загружает
+    первый запрос, остальные отправляют его по file_id. Пока данные не изменились,
+    повторные запросы тоже отправляют уже загруженный файл.
+    send(document, caption) отправляет документ и возвращает сообщение.
+    Возвращает отправленное сообщение или None.
+    """
+    uploaded = _report_files.get(name)
+    metrics.cache_hit('report_file', bool(uploaded) and uploaded[0] == version)
+    if uploaded and uploaded[0] == version:
+        _report_files.move_to_end(name)
+        return await send(uploaded[1], uploaded[2])
+
+    key = (name, version)
+    sent = None
+
+    async def build_and_upload():
+        nonlocal sent
+        report = await build()
+        if report is None:
+            return None
+        data, caption = report
+        sent = await send(BufferedInputFile(data, filename=filename), caption)
+        _report_files[name] = (version, sent.document.file_id, caption)
+        _report_files.move_to_end(name)
+        while len(_report_files) > REPORT_FILES_LIMIT:
+            _report_files.popitem(last=False)
+        return sent.document.file_id, caption
+
+    task = _report_flights.get(key)
+    if task is None:
+        task = _report_flights[key] = asyncio.create_task(build_and_upload())
+        task.add_done_callback(lambda _: _report_flights.pop(key, None))
+    # shield: отмена одного запроса не прерывает построение для остальных
+    result = await asyncio.shield(task)
+    if result is None:
+        return None
+    return sent or await send(*result)
 
 @router.callback_query(F.data.startswith("menu:"))
 async def process_menu_callback(callback: CallbackQuery, bot, state):
     try:
         await callback.answer()
     except Exception as e:
-        logger.warning(f"Не удалось ответить на callback: {e}")
+        logger.warning("Не удалось ответить на callback: %s", e)
 
     action = callback.data.split(":")[1]
     user_id = callback.from_user.id
     chat_id = callback.message.chat.id
 
     if action == "inventory":
-        if chat_id in last_inventory_message:
-            try:
-                await bot.delete_message(chat_id, last_inventory_message[chat_id])
-            except Exception as e:
-                logger.warning(f"Не удалось удалить старое сообщение ассортимента: {e}")
-        msg = await show_inventory(bot, chat_id)
-        if msg:
-            last_inventory_message[chat_id] = msg.message_id
+        await messages.delete(bot, chat_id, "inventory")
+        msg = await send_shared_report(
+            "inventory",
+            await get_data_version("inventory"),
+            build_inventory_report,
+            lambda document, caption: bot.send_document(chat_id, document, caption=caption),
+            filename="assortiment.txt"
+        )
+        if msg is None:
+            msg = await bot.send_message(chat_id, "📭 Ассортимент пуст.")
+        await messages.remember("inventory", chat_id, msg.message_id)
     elif action == "stats":
-        if chat_id in last_stats_message:
-            try:
-                await bot.delete_message(chat_id, last_stats_message[chat_id])
-            except Exception as e:
-                logger.warning(f"Не удалось удалить старое сообщение статистики: {e}")
+        await messages.delete(bot, chat_id, "stats")
         s = await stats.get_stats()
-        text = (
-            f"📊 Статистика за {s['date']}:\n"
-            f"• Предзаказов: {s['preorders']}\n"
-            f"• Броней: {s['bookings']}\n"
-            f"• Продаж: {s['sales']}"
-        )
+        text = stats_text(s)
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="🔄 Сбросить статистику", callback_data="reset_stats:confirm")]
         ])
         msg = await callback.message.answer(text, reply_markup=keyboard)
-        last_stats_message[chat_id] = msg.message_id
+        await messages.remember("stats", chat_id, msg.message_id)
 
     elif action == "finance":
-        if chat_id in last_finance_message:
-            try:
-                await bot.delete_message(chat_id, last_finance_message[chat_id])
-            except Exception as e:
-                logger.warning(f"Не удалось удалить старое сообщение финансов: {e}")
+        await messages.delete(bot, chat_id, "finance")
         s = await stats.get_stats()
-        total = (
-            s['sales_terminal'] + s['preorders_terminal'] +
-            s['sales_cash'] + s['preorders_cash'] +
-            s['sales_qr'] + s['preorders_qr'] +
-            s['sales_installment'] + s['preorders_installment'] +
-            s['bookings_total']
-        )
-        text = (
-            f"💰 Финансы за {s['date']}:\n"
-            f"Терминал: {s['sales_terminal'] + s['preorders_terminal']:.0f} руб.\n"
-            f"Наличные: {s['sales_cash'] + s['preorders_cash']:.0f} руб.\n"
-            f"QR-код: {s['sales_qr'] + s['preorders_qr']:.0f} руб.\n"
-            f"Рассрочка: {s['sales_installment'] + s['preorders_installment']:.0f} руб.\n"
-            f"ИТОГО: {total:.0f} руб."
-        )
+        text = finance_text(s)
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="🔄 Сбросить финансы", callback_data="reset_finances:confirm")]
         ])
         msg = await callback.message.answer(text, reply_markup=keyboard)
-        last_finance_message[chat_id] = msg.message_id
+        await messages.remember("finance", chat_id, msg.message_id)
 
     elif action == "export_assortment":
         await export_assortment_to_topic(bot, user_id)
@@ -149,7 +188,7 @@ async def process_confirm_clear(callback: CallbackQuery, bot):
     try:
         await callback.answer()
     except Exception as e:
-        logger.warning(f"Не удалось ответить на callback: {e}")
+        logger.warning("Не удалось ответить на callback: %s", e)
 
     action = callback.data.split(":")[1]
     chat_id = callback.message.chat.id
@@ -158,10 +197,7 @@ async def process_confirm_clear(callback: CallbackQuery, bot):
         if action == "yes":
             await inventory.save_inventory([])
             await stats.reset_stats()
-            if chat_id in last_stats_message:
-                del last_stats_message[chat_id]
-            if chat_id in last_finance_message:
-                del last_finance_message[chat_id]
+            await messages.forget(chat_id, "stats", "finance")
             await callback.message.edit_text("✅ Ассортимент полностью очищен. Статистика и финансы сброшены.")
         else:
             await callback.message.edit_text("❌ Очистка отменена.")
@@ -175,7 +211,7 @@ async def process_reset_stats(callback: CallbackQuery):
     try:
         await callback.answer()
     except Exception as e:
-        logger.warning(f"Не удалось ответить на callback: {e}")
+        logger.warning("Не удалось ответить на callback: %s", e)
 
     action = callback.data.split(":")[1]
     chat_id = callback.message.chat.id
@@ -189,29 +225,19 @@ async def process_reset_stats(callback: CallbackQuery):
         elif action == "yes":
             await stats.reset_stats()
             s = await stats.get_stats()
-            text = (
-                f"📊 Статистика за {s['date']}:\n"
-                f"• Предзаказов: {s['preorders']}\n"
-                f"• Броней: {s['bookings']}\n"
-                f"• Продаж: {s['sales']}"
-            )
+            text = stats_text(s)
             await callback.message.edit_text(text)
-            last_stats_message[chat_id] = callback.message.message_id
+            await messages.remember("stats", chat_id, callback.message.message_id)
         elif action == "no":
             s = await stats.get_stats()
-            text = (
-                f"📊 Статистика за {s['date']}:\n"
-                f"• Предзаказов: {s['preorders']}\n"
-                f"• Броней: {s['bookings']}\n"
-                f"• Продаж: {s['sales']}"
-            )
+            text = stats_text(s)
             await callback.message.edit_text(text)
-            last_stats_message[chat_id] = callback.message.message_id
+            await messages.remember("stats", chat_id, callback.message.message_id)
     except TelegramBadRequest as e:
         if "message is not modified" not in str(e):
             raise
     except Exception as e:
-        logger.exception(f"Ошибка в process_reset_stats: {e}")
+        logger.exception("Ошибка в process_reset_stats: %s", e)
         await callback.message.answer("❌ Произошла ошибка")
 
 @router.callback_query(F.data.startswith("reset_finances:"))
@@ -219,7 +245,7 @@ async def process_reset_finances(callback: CallbackQuery):
     try:
         await callback.answer()
     except Exception as e:
-        logger.warning(f"Не удалось ответить на callback: {e}")
+        logger.warning("Не удалось ответить на callback: %s", e)
 
     action = callback.data.split(":")[1]
     chat_id = callback.message.chat.id
@@ -233,47 +259,19 @@ async def process_reset_finances(callback: CallbackQuery):
         elif action == "yes":
             await stats.reset_finances()
             s = await stats.get_stats()
-            total = (
-                s['sales_terminal'] + s['preorders_terminal'] +
-                s['sales_cash'] + s['preorders_cash'] +
-                s['sales_qr'] + s['preorders_qr'] +
-                s['sales_installment'] + s['preorders_installment'] +
-                s['bookings_total']
-            )
-            text = (
-                f"💰 Финансы за {s['date']}:\n"
-                f"Терминал: {s['sales_terminal'] + s['preorders_terminal']:.0f} руб.\n"
-                f"Наличные: {s['sales_cash'] + s['preorders_cash']:.0f} руб.\n"
-                f"QR-код: {s['sales_qr'] + s['preorders_qr']:.0f} руб.\n"
-                f"Рассрочка: {s['sales_installment'] + s['preorders_installment']:.0f} руб.\n"
-                f"ИТОГО: {total:.0f} руб."
-            )
+            text = finance_text(s)
             await callback.message.edit_text(text)
-            last_finance_message[chat_id] = callback.message.message_id
+            await messages.remember("finance", chat_id, callback.message.message_id)
         elif action == "no":
             s = await stats.get_stats()
-            total = (
-                s['sales_terminal'] + s['preorders_terminal'] +
-                s['sales_cash'] + s['preorders_cash'] +
-                s['sales_qr'] + s['preorders_qr'] +
-                s['sales_installment'] + s['preorders_installment'] +
-                s['bookings_total']
-            )
-            text = (
-                f"💰 Финансы за {s['date']}:\n"
-                f"Терминал: {s['sales_terminal'] + s['preorders_terminal']:.0f} руб.\n"
-                f"Наличные: {s['sales_cash'] + s['preorders_cash']:.0f} руб.\n"
-                f"QR-код: {s['sales_qr'] + s['preorders_qr']:.0f} руб.\n"
-                f"Рассрочка: {s['sales_installment'] + s['preorders_installment']:.0f} руб.\n"
-                f"ИТОГО: {total:.0f} руб."
-            )
+            text = finance_text(s)
             await callback.message.edit_text(text)
-            last_finance_message[chat_id] = callback.message.message_id
+            await messages.remember("finance", chat_id, callback.message.message_id)
     except TelegramBadRequest as e:
         if "message is not modified" not in str(e):
             raise
     except Exception as e:
-        logger.exception(f"Ошибка в process_reset_finances: {e}")
+        logger.exception("Ошибка в process_reset_finances: %s", e)
         await callback.message.answer("❌ Произошла ошибка")
 
 # ---------- Обработчик для выбора месяца (клиенты) ----------
@@ -282,80 +280,64 @@ async def process_month_selection(callback: CallbackQuery):
     try:
         await callback.answer()
     except Exception as e:
-        logger.warning(f"Не удалось ответить на callback: {e}")
+        logger.warning("Не удалось ответить на callback: %s", e)
 
     month = callback.data.split(":")[1]
     chat_id = callback.message.chat.id
 
-    if chat_id in last_clients_month_message:
-        try:
-            await callback.bot.delete_message(chat_id, last_clients_month_message[chat_id])
-        except Exception as e:
-            logger.warning(f"Не удалось удалить старое сообщение отчёта: {e}")
+    await messages.delete(callback.bot, chat_id, "clients_month")
 
     await callback.message.edit_text(f"⏳ Формирую отчёт за {month}...")
 
-    try:
-        rows = await get_clients_data_for_month(month)
-
-        if not rows:
-            await safe_delete(callback.message)
-            await callback.message.answer("📭 Нет данных за этот месяц.")
-            keyboard = get_main_menu_keyboard()
-            await callback.message.answer("Выберите действие:", reply_markup=keyboard)
-            return
-
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False, encoding='utf-8') as tmp:
-            writer = csv.writer(tmp)
-            writer.writerow([
-                'ID клиента', 'ФИО', 'Телефон', 'Все телефоны', 'Telegram', 'Соцсети', 'Источник',
-                'Дата регистрации клиента',
-                'ID покупки', 'Дата покупки', 'Товары', 'Сумма', 'Способ оплаты (JSON)', 'Тип покупки'
-            ])
-
-            for row in rows:
-                items_text = ''
-                if row['items_json']:
-                    try:
-                        items = json.loads(row['items_json'])
-                        items_text = '; '.join([f"{it.get('item_text', '')[:50]} ({it.get('price', '')}₽)" for it in items])
-                    except:
-                        items_text = row['items_json']
-
-                writer.writerow([
-                    row['client_id'],
-                    row['full_name'],
-                    row['phone'],
-                    row['phones'],
-                    row['telegram_username'],
-                    row['social_network'],
-                    row['referral_source'],
-                    row['client_created_at'],
-                    row['purchase_id'],
-                    row['purchase_created_at'],
-                    items_text,
-                    row['total_amount'],
-                    row['payment_details'],
-                    row['purchase_type']
-                ])
-
-            tmp_path = tmp.name
-
+    async def send(document, caption):
         await safe_delete(callback.message)
+        return await callback.message.answer_document(document, caption=caption)
 
-        sent = await callback.message.answer_document(
-            FSInputFile(tmp_path, filename=f"clients_{month}.csv"),
-            caption=f"📁 Данные клиентов за {month}"
-        )
-        last_clients_month_message[chat_id] = sent.message_id
-
-        os.unlink(tmp_path)
+    try:
+        from reports import build_month_csv, is_closed_month
+        caption = f"📁 Данные клиентов за {month}"
+        # Закрытые месяцы не меняются: отчёт строится один раз, дальше отправляется по file_id
+        closed = is_closed_month(month)
+        cached = await get_month_report(month) if closed else None
+        if closed:
+            metrics.cache_hit('month_report', bool(cached))
+        if cached and cached['file_id']:
+            sent = await send(cached['file_id'], caption)
+        else:
+            # Версия берётся до чтения данных: изменение клиентов во время построения
+            # не даст сохранить устаревший отчёт
+            reports_version = await get_data_version("month_reports") if closed else None
+
+            async def build():
+                if cached:
+                    return cached['csv'], caption
+                rows = await get_clients_data_for_month(month)
+                if not rows:
+                    return None
+                csv_data = await run_report(build_month_csv, rows, heavy=True)
+                if closed:
+                    await save_month_report(month, csv_data, reports_version)
+                return csv_data, caption
+
+            sent = await send_shared_report(
+                f"month:{month}", await get_data_version("clients"), build, send,
+                filename=f"clients_{month}.csv"
+            )
+            if sent is None:
+                await safe_delete(callback.message)
+                await callback.message.answer("📭 Нет данных за этот месяц.")
+                keyboard = get_main_menu_keyboard()
+                await callback.message.answer("Выберите действие:", reply_markup=keyboard)
+                return
+            if closed:
+                await set_month_report_file_id(month, sent.document.file_id)
+        await messages.remember("clients_month", chat_id, sent.message_id)
 
         keyboard = get_main_menu_keyboard()
         await callback.message.answer("Выберите действие:", reply_markup=keyboard)
 
     except Exception as e:
-        logger.exception(f"Ошибка при формировании отчёта за {month}")
+        logger.exception("Ошибка при формировании отчёта за %s", month)
         await safe_delete(callback.message)
         await callback.message.answer("❌ Произошла ошибка при формировании отчёта.")
         keyboard = get_main_menu_keyboard()
@@ -367,60 +349,38 @@ async def process_remains(callback: CallbackQuery):
     try:
         await callback.answer("⏳ Формирую отчёт по остаткам...")
     except Exception as e:
-        logger.warning(f"Не удалось ответить на callback: {e}")
+        logger.warning("Не удалось ответить на callback: %s", e)
 
     chat_id = callback.message.chat.id
 
-    if chat_id in last_remains_message:
-        try:
-            await callback.bot.delete_message(chat_id, last_remains_message[chat_id])
-        except Exception as e:
-            logger.warning(f"Не удалось удалить старое сообщение остатков: {e}")
+    await messages.delete(callback.bot, chat_id, "remains")
 
-    conn = await asyncpg.connect(config.DATABASE_URL)
-    try:
-        rows = await conn.fetch('''
-            SELECT i.text 
-            FROM items i
-            JOIN categories c ON i.category_id = c.id
-            WHERE i.is_booked = false 
-              AND c.name NOT IN ('Б/У:', 'Б/У', 'NS:', 'NS')
-        ''')
-    finally:
-        await conn.close()
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    async def build():
+        from reports import build_remains_csv
+        rows = await get_remains()
+        if not rows:
+            return None
+        groups = {(row['model_name'], row['sim_type']): row['count'] for row in rows}
+        return await run_report(build_remains_csv, groups), f"📦 Остатки на {today}"
 
-    if not rows:
+    async def send(document, caption):
+        await safe_delete(callback.message)
+        return await callback.message.answer_document(document, caption=caption)
+
+    # Дата входит в версию: подпись отчёта меняется каждый день, даже без изменений в данных
+    sent = await send_shared_report(
+        "remains", (await get_data_version("inventory"), today), build, send,
+        filename=f"remains_{today}.csv"
+    )
+    if sent is None:
         await safe_delete(callback.message)
         await callback.message.answer("📭 Нет товаров в наличии.")
         keyboard = get_main_menu_keyboard()
         await callback.message.answer("Выберите действие:", reply_markup=keyboard)
         return
-
-    groups = {}
-    for row in rows:
-        text = row['text']
-        full_name = get_full_model_name(text)
-        sim = detect_sim_type(text)
-        key = (full_name, sim)
-        groups[key] = groups.get(key, 0) + 1
-
-    today = datetime.now().strftime("%Y-%m-%d")
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False, encoding='utf-8') as tmp:
-        writer = csv.writer(tmp)
-        writer.writerow(['Модель', 'Тип SIM', 'Количество'])
-        for (full_name, sim), count in sorted(groups.items()):
-            writer.writerow([full_name, sim if sim != 'other' else '', count])
-        tmp_path = tmp.name
-
-    await safe_delete(callback.message)
-
-    sent = await callback.message.answer_document(
-        FSInputFile(tmp_path, filename=f"remains_{today}.csv"),
-        caption=f"📦 Остатки на {today}"
-    )
-    last_remains_message[chat_id] = sent.message_id
-
-    os.unlink(tmp_path)
+    await messages.remember("remains", chat_id, sent.message_id)
 
     keyboard = get_main_menu_keyboard()
     await callback.message.answer("Выберите действие:", reply_markup=keyboard)
@@ -431,7 +391,7 @@ async def process_clean_empty(callback: CallbackQuery):
     try:
         await callback.answer()
     except Exception as e:
-        logger.warning(f"Не удалось ответить на callback: {e}")
+        logger.warning("Не удалось ответить на callback: %s", e)
 
     if callback.from_user.id != config.ADMIN_ID:
         await callback.answer("⛔ Доступ запрещён", show_alert=True)
@@ -460,7 +420,7 @@ async def process_delete_category(callback: CallbackQuery):
     try:
         await callback.answer()
     except Exception as e:
-        logger.warning(f"Не удалось ответить на callback: {e}")
+        logger.warning("Не удалось ответить на callback: %s", e)
 
     if callback.from_user.id != config.ADMIN_ID:
         await callback.answer("⛔ Доступ запрещён", show_alert=True)
@@ -486,7 +446,7 @@ async def process_merge_categories(callback: CallbackQuery):
     try:
         await callback.answer()
     except Exception as e:
-        logger.warning(f"Не удалось ответить на callback: {e}")
+        logger.warning("Не удалось ответить на callback: %s", e)
 
     if callback.from_user.id != config.ADMIN_ID:
         await callback.answer("⛔ Доступ запрещён", show_alert=True)
@@ -496,24 +456,20 @@ async def process_merge_categories(callback: CallbackQuery):
     from_id = int(from_id)
     to_id = int(to_id)
 
-    conn = await asyncpg.connect(config.DATABASE_URL)
     try:
-        async with conn.transaction():
-            await conn.execute('UPDATE items SET category_id = $1 WHERE category_id = $2', to_id, from_id)
-            await conn.execute('DELETE FROM categories WHERE id = $1', from_id)
+        await merge_categories(from_id, to_id)
+        inventory.invalidate_cache()
         await callback.message.edit_text(f"✅ Товары перенесены, категория {from_id} удалена.")
     except Exception as e:
         logger.exception("Ошибка при слиянии")
         await callback.message.edit_text("❌ Произошла ошибка.")
-    finally:
-        await conn.close()
 
 @router.callback_query(F.data.startswith("reset_assortment:"))
 async def process_reset_assortment(callback: CallbackQuery):
     try:
         await callback.answer()
     except Exception as e:
-        logger.warning(f"Не удалось ответить на callback: {e}")
+        logger.warning("Не удалось ответить на callback: %s", e)
 
     if callback.from_user.id != config.ADMIN_ID:
         await callback.answer("⛔ Доступ запрещён", show_alert=True)
@@ -523,16 +479,12 @@ async def process_reset_assortment(callback: CallbackQuery):
     if action != "confirm":
         return
 
-    conn = await asyncpg.connect(config.DATABASE_URL)
     try:
-        async with conn.transaction():
-            await conn.execute("DELETE FROM categories")
+        await inventory.save_inventory([])
         await callback.message.edit_text("✅ Ассортимент полностью очищен.")
     except Exception as e:
         logger.exception("Ошибка при сбросе ассортимента")
         await callback.message.edit_text("❌ Произошла ошибка.")
-    finally:
-        await conn.close()
 
 # ---------- Подтверждение удаления клиента ----------
 @router.callback_query(F.data.startswith("delete_client:"))
@@ -540,7 +492,7 @@ async def process_delete_client(callback: CallbackQuery):
     try:
         await callback.answer()
     except Exception as e:
-        logger.warning(f"Не удалось ответить на callback: {e}")
+        logger.warning("Не удалось ответить на callback: %s", e)
 
     if callback.from_user.id != config.ADMIN_ID:
         await callback.answer("⛔ Доступ запрещён", show_alert=True)
@@ -565,7 +517,7 @@ async def process_delete_purchase(callback: CallbackQuery):
     try:
         await callback.answer()
     except Exception as e:
-        logger.warning(f"Не удалось ответить на callback: {e}")
+        logger.warning("Не удалось ответить на callback: %s", e)
 
     if callback.from_user.id != config.ADMIN_ID:
         await callback.answer("⛔ Доступ запрещён", show_alert=True)
@@ -582,9 +534,29 @@ async def process_delete_purchase(callback: CallbackQuery):
     finally:
         await conn.close()
 
+# ---------- Подтверждение архивирования старых месяцев ----------
+@router.callback_query(F.data.startswith("archive_partitions:"))
+async def process_archive_partitions(callback: CallbackQuery):
+    try:
+        await callback.answer()
+    except Exception as e:
+        logger.warning("Не удалось ответить на callback: %s", e)
+
+    if callback.from_user.id != config.ADMIN_ID:
+        await callback.answer("⛔ Доступ запрещён", show_alert=True)
+        return
+
+    before = datetime.strptime(callback.data.split(":")[1], "%m.%Y").date()
+    try:
+        detached = await archive_partitions(before)
+        await callback.message.edit_text(f"✅ Отсоединено секций: {len(detached)}")
+    except Exception as e:
+        logger.exception("Ошибка при архивировании секций")
+        await callback.message.edit_text("❌ Произошла ошибка.")
+
 # ---------- Вспомогательная функция для безопасного удаления сообщения ----------
 async def safe_delete(message):
     try:
         await message.delete()
     except Exception as e:
-        logger.warning(f"Не удалось удалить сообщение: {e}")
+        logger.warning("Не удалось удалить сообщение: %s", e)
@@ -1,29 +1,30 @@
-import csv
-import json
-import tempfile
-import os
+from datetime import date, datetime
 from aiogram import F
-from aiogram.types import Message, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command
 
 import config
-from database import search_clients, get_client_purchases, get_pool
+import stats
+from database import (
+    get_client_dossiers, get_clients_by_model, get_pool, rebuild_stock_levels, ensure_partitions,
+    rebuild_daily_summary, month_partitions
+)
 from .base import (
-    router, logger, show_inventory, cancel_action, get_main_menu_keyboard, show_help
+    router, logger, show_inventory, cancel_action, get_main_menu_keyboard, show_help, paginate
 )
 
 @router.message(Command("start"))
 async def cmd_start(message: Message, bot):
-    logger.info(f"🔥 Команда /start получена от {message.from_user.id}")
+    logger.info("🔥 Команда /start получена от %s", message.from_user.id)
     try:
         keyboard = get_main_menu_keyboard()
         await message.answer(
             "👋 Добро пожаловать! Используйте кнопки ниже для управления.",
             reply_markup=keyboard
         )
-        logger.info(f"✅ Ответ на /start отправлен пользователю {message.from_user.id}")
+        logger.info("✅ Ответ на /start отправлен пользователю %s", message.from_user.id)
     except Exception as e:
-        logger.exception(f"❌ Ошибка при обработке /start: {e}")
+        logger.exception("❌ Ошибка при обработке /start: %s", e)
 
 @router.message(Command("inventory"))
 async def cmd_inventory(message: Message, bot):
@@ -38,39 +39,68 @@ async def cmd_cancel(message: Message, bot, state):
 async def cmd_help(message: Message, bot):
     await show_help(bot, message.chat.id)
 
+def _parse_date(value: str) -> date:
+    return datetime.strptime(value, "%d.%m.%Y").date()
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    args = message.text.split()[1:]
+    try:
+        date_from = _parse_date(args[0]) if args else date.today()
+        date_to = _parse_date(args[1]) if len(args) > 1 else date_from
+    except ValueError:
+        await message.answer("Формат: /stats ДД.ММ.ГГГГ [ДД.ММ.ГГГГ]")
+        return
+    if date_from > date_to:
+        date_from, date_to = date_to, date_from
+
+    s = await stats.get_stats_for_range(date_from, date_to)
+    period = f"{date_from:%d.%m.%Y}" if date_from == date_to else f"{date_from:%d.%m.%Y} – {date_to:%d.%m.%Y}"
+    blocks = [(
+        f"📊 Статистика за {period}:\n"
+        f"• Предзаказов: {s['preorders']}\n"
+        f"• Броней: {s['bookings']}\n"
+        f"• Продаж: {s['sales']}\n\n"
+        f"💰 Финансы:\n"
+        f"Терминал: {s['terminal']:.0f} руб.\n"
+        f"Наличные: {s['cash']:.0f} руб.\n"
+        f"QR-код: {s['qr']:.0f} руб.\n"
+        f"Рассрочка: {s['installment']:.0f} руб.\n"
+        f"Брони: {s['bookings_total']:.0f} руб.\n"
+        f"ИТОГО: {s['total']:.0f} руб.\n"
+    )]
+    if date_from != date_to:
+        days = await stats.get_stats_by_day(date_from, date_to)
+        if days:
+            blocks.append("\nПо дням:\n")
+        for day in days:
+            blocks.append(f"{day['day']:%d.%m.%Y}: продаж {day['sales']}, предзаказов {day['preorders']}, "
+                          f"броней {day['bookings']}, {day['total']:.0f} руб.\n")
+    for page in paginate(blocks):
+        await message.answer(page)
+
+def _wants_gzip(message: Message) -> bool:
+    """Экспорт сжимается gzip, если после команды указано «gz» или «gzip»."""
+    return any(arg.lower() in ('gz', 'gzip') for arg in message.text.split()[1:])
+
 @router.message(Command("export_clients"))
 async def cmd_export_clients(message: Message):
     if message.from_user.id != config.ADMIN_ID:
         await message.answer("⛔ Доступ запрещён")
         return
 
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch('SELECT * FROM clients ORDER BY id')
-
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False, encoding='utf-8') as tmp:
-        writer = csv.writer(tmp)
-        writer.writerow(['ID', 'ФИО', 'Основной телефон', 'Все телефоны', 'Telegram', 'Соцсети', 'Источник', 'Дата регистрации'])
-        for row in rows:
-            writer.writerow([
-                row['id'],
-                row['full_name'],
-                row['phone'],
-                row['phones'],
-                row['telegram_username'],
-                row['social_network'],
-                row['referral_source'],
-                row['created_at']
-            ])
-        tmp_path = tmp.name
-
-    try:
-        await message.answer_document(
-            FSInputFile(tmp_path, filename="clients.csv"),
-            caption="📁 Экспорт клиентов"
-        )
-    finally:
-        os.unlink(tmp_path)
+    from csv_export import CsvExportFile
+    document = CsvExportFile(
+        "clients.csv",
+        ['ID', 'ФИО', 'Основной телефон', 'Все телефоны', 'Telegram', 'Соцсети', 'Источник', 'Дата регистрации'],
+        '''
+            SELECT id, full_name, phone, phones, telegram_username,
+                   social_network, referral_source, created_at
+            FROM clients ORDER BY id
+        ''',
+        compress=_wants_gzip(message)
+    )
+    await message.answer_document(document, caption="📁 Экспорт клиентов")
 
 @router.message(Command("export_purchases"))
 async def cmd_export_purchases(message: Message):
@@ -78,32 +108,25 @@ async def cmd_export_purchases(message: Message):
         await message.answer("⛔ Доступ запрещён")
         return
 
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch('SELECT * FROM purchases ORDER BY id')
-
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False, encoding='utf-8') as tmp:
-        writer = csv.writer(tmp)
-        writer.writerow(['ID покупки', 'ID клиента', 'Товары (JSON)', 'Сумма', 'Оплата (JSON)', 'Тип', 'Дата'])
-        for row in rows:
-            writer.writerow([
-                row['id'],
-                row['client_id'],
-                row['items_json'],
-                row['total_amount'],
-                row['payment_details'],
-                row['purchase_type'],
-                row['created_at']
-            ])
-        tmp_path = tmp.name
+    from csv_export import CsvExportFile
+    document = CsvExportFile(
+        "purchases.csv",
+        ['ID покупки', 'ID клиента', 'Товары (JSON)', 'Сумма', 'Оплата (JSON)', 'Тип', 'Дата'],
+        '''
+            SELECT id, client_id, items_json::text, total_amount,
+                   payment_details::text, purchase_type, created_at
+            FROM purchases ORDER BY id
+        ''',
+        compress=_wants_gzip(message)
+    )
+    await message.answer_document(document, caption="📁 Экспорт покупок")
 
-    try:
-        await message.answer_document(
-            FSInputFile(tmp_path, filename="purchases.csv"),
-            caption="📁 Экспорт покупок"
-        )
-    finally:
-        os.unlink(tmp_path)
+def _format_payments(payments: dict | None) -> str:
+    """Ненулевые способы оплаты: «cash 1000.0, qr 500.0»."""
+    if isinstance(payments, str):
+        return payments
+    parts = [f"{method} {amount}" for method, amount in (payments or {}).items() if amount]
+    return ', '.join(parts) or '—'
 
 @router.message(Command("client_info"))
 async def cmd_client_info(message: Message):
@@ -116,12 +139,13 @@ async def cmd_client_info(message: Message):
         await message.answer("Укажите телефон или имя клиента")
         return
 
-    clients = await search_clients(args)
+    clients = await get_client_dossiers(args)
     if not clients:
         await message.answer("Клиент не найден")
         return
 
     for client in clients:
+        blocks = []
         text = f"👤 *Клиент ID {client['id']}*\n"
         text += f"ФИО: {client['full_name'] or '—'}\n"
         text += f"Основной телефон: {client['phone'] or '—'}\n"
@@ -129,25 +153,55 @@ async def cmd_client_info(message: Message):
         text += f"Telegram: @{client['telegram_username'] or '—'}\n"
         text += f"Соцсети: {client['social_network'] or '—'}\n"
         text += f"Источник: {client['referral_source'] or '—'}\n"
-        text += f"Дата регистрации: {client['created_at']}\n\n"
-
-        purchases = await get_client_purchases(client['id'])
-        if purchases:
+        text += f"Дата регистрации: {client['created_at']}\n"
+        if client['purchase_count']:
+            text += (f"Покупок: {client['purchase_count']}, на сумму {client['lifetime_spend']:.2f}₽, "
+                     f"последняя: {client['last_purchase']:%d.%m.%Y}\n\n")
             text += "*Покупки:*\n"
-            for p in purchases:
-                text += f"📅 {p['created_at']}\n"
-                items = json.loads(p['items_json']) if p['items_json'] else []
+            blocks.append(text)
+            for p in client['purchases']:
+                text = f"📅 {p['created_at']}\n"
+                items = p['items'] or []
+                if isinstance(items, str):
+                    # Старая покупка, сохранённая до перевода в JSONB как невалидный JSON
+                    items = [{'item_text': items}]
                 for item in items:
                     text += f"  • {item['item_text'][:50]}"
                     if item.get('price'):
                         text += f" - {item['price']}₽"
                     text += "\n"
                 text += f"  💰 Сумма: {p['total_amount']}₽\n"
-                text += f"  💳 Оплата: {p['payment_details']}\n"
+                text += f"  💳 Оплата: {_format_payments(p['payment_details'])}\n"
                 text += f"  🏷️ Тип: {p['purchase_type']}\n\n"
+                blocks.append(text)
         else:
-            text += "Нет покупок\n"
-        await message.answer(text, parse_mode='Markdown')
+            blocks.append(text + "\nНет покупок\n")
+        # Каждый клиент начинается с новой страницы, длинная история делится на несколько
+        for page in paginate(blocks):
+            await message.answer(page, parse_mode='Markdown')
+
+@router.message(Command("bought"))
+async def cmd_bought(message: Message):
+    if message.from_user.id != config.ADMIN_ID:
+        await message.answer("⛔ Доступ запрещён")
+        return
+
+    model_name = message.text.replace('/bought', '').strip()
+    if not model_name:
+        await message.answer("Укажите модель, например: /bought iPhone 15 Pro 256GB")
+        return
+
+    clients = await get_clients_by_model(model_name)
+    if not clients:
+        await message.answer("Покупок этой модели не найдено")
+        return
+
+    lines = [f"🔎 Покупали «{model_name}» (клиентов: {len(clients)}):\n"]
+    for client in clients:
+        lines.append(f"• ID {client['id']} {client['full_name'] or '—'}, {client['phone'] or '—'}"
+                     f" – покупок: {client['purchase_count']}, последняя: {client['last_purchase']:%d.%m.%Y}\n")
+    for page in paginate(lines):
+        await message.answer(page)
 
 @router.message(Command("export_full_report"))
 async def cmd_export_full_report(message: Message):
@@ -155,41 +209,24 @@ async def cmd_export_full_report(message: Message):
         await message.answer("⛔ Доступ запрещён")
         return
 
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch('''
-            SELECT c.id, c.full_name, c.phone, c.telegram_username,
-                   p.created_at, p.items_json, p.total_amount, p.payment_details
+    from csv_export import CsvExportFile
+    document = CsvExportFile(
+        "full_report.csv",
+        ['ID клиента', 'ФИО', 'Телефон', 'Telegram', 'Дата покупки', 'Товары', 'Сумма', 'Способ оплаты'],
+        '''
+            SELECT c.id, c.full_name, c.phone, c.telegram_username, p.created_at,
+                   CASE WHEN jsonb_typeof(p.items_json) = 'array' THEN
+                       (SELECT string_agg(left(it->>'item_text', 30) || '...', ', ')
+                        FROM jsonb_array_elements(p.items_json) it)
+                   ELSE p.items_json #>> '{}' END,
+                   p.total_amount, p.payment_details::text
             FROM clients c
             LEFT JOIN purchases p ON c.id = p.client_id
             ORDER BY c.id, p.created_at
-        ''')
-
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False, encoding='utf-8') as tmp:
-        writer = csv.writer(tmp)
-        writer.writerow(['ID клиента', 'ФИО', 'Телефон', 'Telegram', 'Дата покупки', 'Товары', 'Сумма', 'Способ оплаты'])
-        for row in rows:
-            items = json.loads(row['items_json']) if row['items_json'] else []
-            items_short = ', '.join([it['item_text'][:30] + '...' for it in items])
-            writer.writerow([
-                row['id'],
-                row['full_name'],
-                row['phone'],
-                row['telegram_username'],
-                row['created_at'],
-                items_short,
-                row['total_amount'],
-                row['payment_details']
-            ])
-        tmp_path = tmp.name
-
-    try:
-        await message.answer_document(
-            FSInputFile(tmp_path, filename="full_report.csv"),
-            caption="📁 Полный отчёт (клиенты и покупки)"
-        )
-    finally:
-        os.unlink(tmp_path)
+        ''',
+        compress=_wants_gzip(message)
+    )
+    await message.answer_document(document, caption="📁 Полный отчёт (клиенты и покупки)")
 
 # ---------- Команды для управления категориями ----------
 @router.message(Command("show_categories"))
@@ -428,6 +465,42 @@ async def cmd_migrate(message: Message):
             result = await conn.execute("UPDATE items SET is_booked = TRUE WHERE text ILIKE '%Бронь от%'")
             updated = result.split()[-1]
             await conn.execute('CREATE INDEX IF NOT EXISTS idx_items_is_booked ON items(is_booked)')
+            await rebuild_stock_levels()
+            # Итоги по дням пересчитываются из продаж, предзаказов и броней (например, после правок в БД)
+            await rebuild_daily_summary()
+            await ensure_partitions()
             await message.answer(f"✅ Миграция выполнена!\nОбновлено записей: {updated}")
         except Exception as e:
             await message.answer(f"❌ Ошибка: {e}")
+
+# ---------- Архивирование старых месяцев ----------
+@router.message(Command("archive_partitions"))
+async def cmd_archive_partitions(message: Message):
+    if message.from_user.id != config.ADMIN_ID:
+        await message.answer("⛔ Доступ запрещён")
+        return
+
+    args = message.text.split()
+    try:
+        before = datetime.strptime(args[1], "%m.%Y").date()
+    except (IndexError, ValueError):
+        await message.answer("❌ Используйте: /archive_partitions ММ.ГГГГ (месяцы раньше указанного)")
+        return
+    if before > date.today().replace(day=1):
+        await message.answer("❌ Текущий месяц и будущие архивировать нельзя.")
+        return
+
+    partitions = await month_partitions(before)
+    if not partitions:
+        await message.answer(f"📭 Нет секций раньше {before:%m.%Y}.")
+        return
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Да, архивировать", callback_data=f"archive_partitions:{before:%m.%Y}")],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="menu:cancel")]
+    ])
+    await message.answer(
+        f"⚠️ Отсоединить {len(partitions)} секций раньше {before:%m.%Y}?\n"
+        "Данные останутся в отдельных таблицах, но пропадут из отчётов и выгрузок.\n"
+        + "\n".join(partitions),
+        reply_markup=keyboard
+    )
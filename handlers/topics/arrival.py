@@ -1,7 +1,6 @@
 import re
 import tempfile
 import os
-import aiofiles
 from datetime import datetime
 from aiogram import F, Router
 from aiogram.types import Message, CallbackQuery, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
@@ -9,9 +8,10 @@ from aiogram.fsm.context import FSMContext
 
 import config
 import inventory
-from database import get_all_items_serials, add_item
+from database import find_existing_items, add_item
 from sort_assortment import add_item_to_categories
 from handlers.states import ArrivalConfirmState
+from handlers.topics.common import iter_document_lines
 
 router = Router()
 MAX_FILE_SIZE = 10 * 1024 * 1024
@@ -39,15 +39,10 @@ async def handle_arrival(message: Message, bot, state: FSMContext):
         if not (document.mime_type == 'text/plain' or document.file_name.endswith('.txt')):
             await message.reply("⚠️ Отправьте текстовый файл .txt")
             return
-        file_path = f"/tmp/{document.file_name}"
-        await bot.download(document, destination=file_path)
-        try:
-            async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-                content = await f.read()
-            lines = [line.strip() for line in content.splitlines() if line.strip()]
-        finally:
-            if os.path.exists(file_path):
-                os.remove(file_path)
+        async for line in iter_document_lines(bot, document):
+            line = line.strip()
+            if line:
+                lines.append(line)
     else:
         await message.reply("⚠️ Отправьте текст или файл .txt.")
         return
@@ -58,25 +53,26 @@ async def handle_arrival(message: Message, bot, state: FSMContext):
         await message.reply("❌ Нет ни одной позиции после фильтрации.")
         return
 
-    existing_items = await get_all_items_serials()
-    existing_texts = {item['text'] for item in existing_items}
-    existing_serials = {item['serial'] for item in existing_items if item['serial']}
+    # Сверка с ассортиментом выполняется в БД, здесь – только дубликаты внутри самой загрузки
+    serials = [inventory.extract_serial(line) for line in lines]
+    existing = await find_existing_items(lines, serials)
+    seen_texts = set()
+    seen_serials = set()
 
     added_lines = []
     skipped_lines = []
 
-    for line in lines:
-        if line in existing_texts:
+    for line, serial, (text_exists, serial_exists) in zip(lines, serials, existing):
+        if text_exists or line in seen_texts:
             skipped_lines.append(f"[Дубликат текста] {line}")
             continue
-        serial = inventory.extract_serial(line)
-        if serial and serial in existing_serials:
+        if serial and (serial_exists or serial in seen_serials):
             skipped_lines.append(f"[Дубликат серийного номера {serial}] {line}")
             continue
         added_lines.append(line)
-        existing_texts.add(line)
+        seen_texts.add(line)
         if serial:
-            existing_serials.add(serial)
+            seen_serials.add(serial)
 
     if not added_lines:
         await message.reply("❌ Нет новых позиций для добавления (все дубликаты).")
@@ -1,19 +1,37 @@
 import re
-import tempfile
-import os
-import aiofiles
 from aiogram import F, Router
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 
 import config
 import inventory
-from sort_assortment import sort_assortment_to_categories
+from sort_assortment import sort_assortment_to_categories, CategoryParser
 from handlers.states import AssortmentConfirmState
+from handlers.topics.common import iter_document_lines
 
 router = Router()
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
 
+async def _ask_confirm(message: Message, state: FSMContext, categories: list):
+    """Сохраняет разобранные категории в состоянии и запрашивает подтверждение."""
+    if not categories:
+        await message.reply("❌ Не удалось распознать ни одной категории.")
+        return
+    diff = await inventory.preview_inventory(categories)
+    await state.update_data(temp_categories=categories)
+    await state.set_state(AssortmentConfirmState.waiting_for_confirm)
+    total_items = sum(len(cat['items']) for cat in categories)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Подтвердить", callback_data="assort_confirm:yes"),
+         InlineKeyboardButton(text="❌ Отмена", callback_data="assort_confirm:no")]
+    ])
+    await message.reply(
+        f"📦 Найдено категорий: {len(categories)}, всего позиций: {total_items}\n"
+        f"Изменения: {inventory.format_diff_summary(diff)} (без изменений: {diff['unchanged']})\n"
+        "Подтвердите загрузку (товары загружаемых категорий будут приведены к этому списку).",
+        reply_markup=keyboard
+    )
+
 @router.message(F.chat.id == config.MAIN_GROUP_ID, F.message_thread_id == config.THREAD_ASSORTMENT)
 async def handle_assortment_upload(message: Message, bot, state: FSMContext):
     """Обрабатывает загрузку нового ассортимента (текст или файл)."""
@@ -22,22 +40,7 @@ async def handle_assortment_upload(message: Message, bot, state: FSMContext):
         if not full_text:
             await message.reply("❌ Пустой список.")
             return
-        categories = sort_assortment_to_categories(full_text)
-        if not categories:
-            await message.reply("❌ Не удалось распознать ни одной категории.")
-            return
-        await state.update_data(temp_categories=categories)
-        await state.set_state(AssortmentConfirmState.waiting_for_confirm)
-        total_items = sum(len(cat['items']) for cat in categories)
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Подтвердить", callback_data="assort_confirm:yes"),
-             InlineKeyboardButton(text="❌ Отмена", callback_data="assort_confirm:no")]
-        ])
-        await message.reply(
-            f"📦 Найдено категорий: {len(categories)}, всего позиций: {total_items}\n"
-            "Подтвердите загрузку (это заменит весь текущий ассортимент).",
-            reply_markup=keyboard
-        )
+        await _ask_confirm(message, state, sort_assortment_to_categories(full_text))
     elif message.document:
         document = message.document
         if document.file_size > MAX_FILE_SIZE:
@@ -46,33 +49,16 @@ async def handle_assortment_upload(message: Message, bot, state: FSMContext):
         if not (document.mime_type == 'text/plain' or document.file_name.endswith('.txt')):
             await message.reply("⚠️ Отправьте текстовый файл .txt")
             return
-        file_path = f"/tmp/{document.file_name}"
-        await bot.download(document, destination=file_path)
-        try:
-            async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-                content = await f.read()
-            if not content.strip():
-                await message.reply("❌ Файл пуст.")
-                return
-            categories = sort_assortment_to_categories(content)
-            if not categories:
-                await message.reply("❌ Не удалось распознать ни одной категории.")
-                return
-            await state.update_data(temp_categories=categories)
-            await state.set_state(AssortmentConfirmState.waiting_for_confirm)
-            total_items = sum(len(cat['items']) for cat in categories)
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="✅ Подтвердить", callback_data="assort_confirm:yes"),
-                 InlineKeyboardButton(text="❌ Отмена", callback_data="assort_confirm:no")]
-            ])
-            await message.reply(
-                f"📦 Найдено категорий: {len(categories)}, всего позиций: {total_items}\n"
-                "Подтвердите загрузку (это заменит весь текущий ассортимент).",
-                reply_markup=keyboard
-            )
-        finally:
-            if os.path.exists(file_path):
-                os.remove(file_path)
+        # Разбираем файл построчно по мере скачивания, не собирая его целиком в памяти
+        parser = CategoryParser()
+        has_content = False
+        async for line in iter_document_lines(bot, document):
+            has_content = has_content or bool(line.strip())
+            parser.feed(line)
+        if not has_content:
+            await message.reply("❌ Файл пуст.")
+            return
+        await _ask_confirm(message, state, parser.close())
     else:
         await message.reply("⚠️ Отправьте текст или файл .txt.")
 
@@ -90,8 +76,11 @@ async def process_assortment_confirm(callback: CallbackQuery, state: FSMContext)
     action = callback.data.split(":")[1]
     if action == "yes":
         if categories:
-            await inventory.save_inventory(categories)
-            await callback.message.edit_text("✅ Ассортимент успешно загружен и сохранён.")
+            diff = await inventory.save_inventory(categories)
+            await callback.message.edit_text(
+                f"✅ Ассортимент успешно загружен и сохранён.\n"
+                f"Изменения: {inventory.format_diff_summary(diff)}"
+            )
         else:
             await callback.message.edit_text("❌ Ошибка: данные не найдены.")
     else:
@@ -1,12 +1,49 @@
+import codecs
 import tempfile
-import os
 from datetime import datetime
 from aiogram import Bot
-from aiogram.types import FSInputFile
+from aiogram.types import BufferedInputFile, Document
 
 import config
 from inventory import load_inventory
-from sort_assortment import build_output_text
+from workers import run_report
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024  # выше этого размера буфер сбрасывается на диск
+
+async def _spooled_chunks(bot: Bot, file_path: str):
+    """Скачивает файл в буфер в памяти (с выгрузкой на диск для больших файлов) и отдаёт его частями."""
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as buffer:
+        await bot.download_file(file_path, destination=buffer, chunk_size=DOWNLOAD_CHUNK_SIZE)
+        while chunk := buffer.read(DOWNLOAD_CHUNK_SIZE):
+            yield chunk
+
+async def iter_document_lines(bot: Bot, document: Document):
+    """
+    Построчно читает текстовый документ из Telegram (UTF-8) без сохранения во временный файл.
+    Строки отдаются по мере поступления байтов, так что разбор начинается до окончания загрузки.
+    Для локального Bot API сервера файл читается через буфер SPOOL_MAX_SIZE.
+    """
+    file = await bot.get_file(document.file_id)
+    if bot.session.api.is_local:
+        chunks = _spooled_chunks(bot, file.file_path)
+    else:
+        chunks = bot.session.stream_content(
+            url=bot.session.api.file_url(bot.token, file.file_path),
+            chunk_size=DOWNLOAD_CHUNK_SIZE,
+            raise_for_status=True
+        )
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    tail = ''
+    async for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).splitlines(keepends=True)
+        # Последняя строка может быть неполной (или оборванной посреди \r\n) – придерживаем её
+        tail = lines.pop() if lines else ''
+        for line in lines:
+            yield line.splitlines()[0]
+    tail += decoder.decode(b'', final=True)
+    for line in tail.splitlines():
+        yield line
 
 async def export_assortment_to_topic(bot: Bot, admin_id: int):
     """Выгружает текущий ассортимент в топик «Ассортимент» и уведомляет админа."""
@@ -14,19 +51,14 @@ async def export_assortment_to_topic(bot: Bot, admin_id: int):
     if not categories:
         await bot.send_message(admin_id, "📭 Ассортимент пуст, нечего выгружать.")
         return
-    text = build_output_text(categories)
+    from reports import build_assortment_file
+    data = await run_report(build_assortment_file, categories, heavy=True)
     today = datetime.now().strftime("%d.%m.%Y")
-    with tempfile.NamedTemporaryFile(mode="w", suffix=".txt", delete=False, encoding="utf-8") as f:
-        f.write(text)
-        tmp_path = f.name
-    try:
-        document = FSInputFile(tmp_path, filename=f"assortiment_{today}.txt")
-        await bot.send_document(
-            chat_id=config.MAIN_GROUP_ID,
-            document=document,
-            caption=f"📦 Текущий ассортимент (категорий: {len(categories)})",
-            message_thread_id=config.THREAD_ASSORTMENT
-        )
-        await bot.send_message(admin_id, "✅ Ассортимент успешно выгружен в топик «Ассортимент».")
-    finally:
-        os.unlink(tmp_path)
+    document = BufferedInputFile(data, filename=f"assortiment_{today}.txt")
+    await bot.send_document(
+        chat_id=config.MAIN_GROUP_ID,
+        document=document,
+        caption=f"📦 Текущий ассортимент (категорий: {len(categories)})",
+        message_thread_id=config.THREAD_ASSORTMENT
+    )
+    await bot.send_message(admin_id, "✅ Ассортимент успешно выгружен в топик «Ассортимент».")
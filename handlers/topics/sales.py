@@ -53,14 +53,14 @@ async def handle_sales_message(message: Message):
                 item_id=item_id,
                 is_accessory=False
             )
-            logger.info(f"✅ Продажа зарегистрирована для товара {serial} (item_id={item_id})")
+            logger.info("✅ Продажа зарегистрирована для товара %s (item_id=%s)", serial, item_id)
 
         for item_id, serial in sold_items:
             removed = await remove_item_by_serial(serial)
             if not removed:
-                logger.warning(f"⚠️ Не удалось удалить товар {serial} после регистрации продажи")
+                logger.warning("⚠️ Не удалось удалить товар %s после регистрации продажи", serial)
             else:
-                logger.info(f"🗑️ Товар {serial} удалён из ассортимента")
+                logger.info("🗑️ Товар %s удалён из ассортимента", serial)
 
     elif cash or terminal or qr or installment:
         await stats.increment_sales(
@@ -72,18 +72,18 @@ async def handle_sales_message(message: Message):
             item_id=None,
             is_accessory=True
         )
-        logger.info(f"✅ Зарегистрирована продажа аксессуаров на сумму {cash+terminal+qr+installment:.0f} руб.")
+        logger.info("✅ Зарегистрирована продажа аксессуаров на сумму %.0f руб.", cash+terminal+qr+installment)
 
     if not_found_serials:
         text = "❌ Серийные номера не найдены в ассортименте:\n" + "\n".join(not_found_serials)
         await message.reply(text)
-        logger.info(f"❌ Не найдены: {not_found_serials}")
+        logger.info("❌ Не найдены: %s", not_found_serials)
 
     if sold_items:
         try:
             await message.react([ReactionTypeEmoji(emoji='🔥')])
         except Exception as e:
-            logger.exception(f"Не удалось поставить реакцию: {e}")
+            logger.exception("Не удалось поставить реакцию: %s", e)
 
     # Сохранение данных клиента
     try:
@@ -104,8 +104,8 @@ async def handle_sales_message(message: Message):
                 payment_details=data['payments'],
                 purchase_type='sale'
             )
-            logger.info(f"✅ Сохранены данные клиента {client_id} с покупкой, телефоны: {data['phones']}")
+            logger.info("✅ Сохранены данные клиента %s с покупкой, телефоны: %s", client_id, data['phones'])
     except ImportError as e:
-        logger.error(f"❌ Ошибка импорта в client_parser: {e}")
+        logger.error("❌ Ошибка импорта в client_parser: %s", e)
     except Exception as e:
-        logger.exception(f"❌ Неожиданная ошибка при сохранении данных клиента: {e}")
+        logger.exception("❌ Неожиданная ошибка при сохранении данных клиента: %s", e)
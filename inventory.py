@@ -1,9 +1,12 @@
 import time
+from collections import deque
 from database import (
     add_item, remove_item_by_serial, get_all_categories_with_items,
-    get_or_create_category, update_category_items, clear_all_inventory
+    get_or_create_category, get_items_with_categories, apply_inventory_diff,
+    clear_all_inventory
 )
 from serial_utils import extract_serial, extract_serials_from_text
+import metrics
 
 # Кеш для ассортимента
 _cache = {"data": None, "timestamp": 0}
@@ -19,7 +22,9 @@ async def load_inventory():
     """Возвращает список ВСЕХ категорий с товарами (включая пустые) с использованием кеша."""
     global _cache
     now = time.time()
-    if _cache["data"] is not None and (now - _cache["timestamp"]) < CACHE_TTL:
+    hit = _cache["data"] is not None and (now - _cache["timestamp"]) < CACHE_TTL
+    metrics.cache_hit('inventory', hit)
+    if hit:
         return _cache["data"]
     # Кеш устарел или пуст – загружаем из БД
     categories = await get_all_categories_with_items()
@@ -27,17 +32,85 @@ async def load_inventory():
     _cache["timestamp"] = now
     return categories
 
+def _category_key(name: str) -> str:
+    return name.lower().rstrip(':')
+
+def _item_key(text: str, serial: str | None):
+    return (serial.strip().upper() if serial else None, text)
+
+def diff_inventory(current_items: list, categories: list) -> dict:
+    """
+    Сравнивает загружаемые категории с текущими товарами (ключ – серийный номер и текст).
+    Товары, уже лежащие в своей категории, не трогаются; найденные в другой категории
+    переносятся; лишние товары загружаемых категорий удаляются, остальные добавляются.
+    """
+    in_place = {}
+    by_key = {}
+    for row in current_items:
+        key = _item_key(row['text'], row['serial'])
+        in_place.setdefault((key, _category_key(row['category_name'])), deque()).append(row)
+        by_key.setdefault(key, deque()).append(row)
+
+    claimed = set()
+    unchanged = 0
+    wanted = []
+    for cat in categories:
+        cat_key = _category_key(cat['header'])
+        for text in cat['items']:
+            key = _item_key(text, extract_serial(text))
+            rows = in_place.get((key, cat_key))
+            if rows:
+                claimed.add(rows.popleft()['id'])
+                unchanged += 1
+            else:
+                wanted.append((key, text, cat['header']))
+
+    inserts = []
+    moves = []
+    for key, text, header in wanted:
+        candidates = by_key.get(key)
+        while candidates and candidates[0]['id'] in claimed:
+            candidates.popleft()
+        if candidates:
+            row = candidates.popleft()
+            claimed.add(row['id'])
+            moves.append((row['id'], header))
+        else:
+            inserts.append((text, key[0], header))
+
+    uploaded = {_category_key(cat['header']) for cat in categories}
+    deletes = [row['id'] for row in current_items
+               if row['id'] not in claimed and _category_key(row['category_name']) in uploaded]
+
+    return {
+        'categories': [cat['header'] for cat in categories],
+        'insert': inserts,
+        'delete': deletes,
+        'move': moves,
+        'unchanged': unchanged,
+    }
+
+def format_diff_summary(diff: dict) -> str:
+    """Краткая сводка изменений: «+N / −M / перемещено K»."""
+    return f"+{len(diff['insert'])} / −{len(diff['delete'])} / перемещено {len(diff['move'])}"
+
+async def preview_inventory(categories):
+    """Возвращает разницу между текущим и загружаемым ассортиментом без изменения БД."""
+    return diff_inventory(await get_items_with_categories(), categories)
+
 async def save_inventory(categories):
-    """Обновляет ассортимент. Если передан пустой список, полностью очищает его."""
+    """
+    Обновляет ассортимент по загруженным категориям, применяя только изменения.
+    Если передан пустой список, полностью очищает его. Возвращает применённую разницу.
+    """
     if not categories:
         await clear_all_inventory()
         invalidate_cache()
-        return
-    for cat in categories:
-        cat_name = cat['header']
-        items = cat['items']
-        await update_category_items(cat_name, items)
+        return None
+    diff = await preview_inventory(categories)
+    await apply_inventory_diff(diff)
     invalidate_cache()
+    return diff
 
 async def remove_by_serial(serial: str) -> int:
     """Удаляет товар по серийному номеру."""
@@ -0,0 +1,403 @@
+"""
+Нагрузочный тест бота целиком: приложение Starlette из server.py поднимается с локальным
+Postgres и поддельным Bot API, на /webhook подаются синтетические обновления.
+
+    python load_test.py --database-url postgresql://postgres@127.0.0.1:5432/loadtest \
+        --duration 60 --rate sales=20,bookings=2,arrivals=0.5,assortment=0.02,menu=1
+
+Сценарии (частота – запусков в секунду, поток Пуассона):
+    sales       – продажа 1–3 товаров с серийными номерами, оплатой и данными клиента
+    bookings    – предзаказ с блоком «Бронь»
+    arrivals    – прибытие новых товаров и подтверждение кнопкой
+    assortment  – загрузка файла ассортимента и подтверждение кнопкой
+    menu        – кнопки меню администратора (статистика, финансы, ассортимент, остатки)
+
+Отчёт: пропускная способность, p50/p95/p99 времени ответа /webhook, запросы к БД
+и к Bot API на одно обновление – по каждому типу обновления.
+
+Тест пишет в базу (ассортимент заменяется), поэтому адрес базы задаётся только явно
+через --database-url – используйте отдельную базу, не рабочую.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from contextvars import ContextVar
+
+import synthetic
+
+DEFAULT_RATES = 'sales=10,bookings=1,arrivals=0.5,assortment=0.02,menu=0.5'
+MENU_ACTIONS = ['stats', 'finance', 'inventory', 'remains']
+LABEL_HEADER = 'x-load-test-label'
+
+# Тип обновления, которое сейчас обрабатывает приложение (для подсчёта запросов к БД и Bot API)
+current_label: ContextVar[str | None] = ContextVar('current_label', default=None)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест вебхука бота')
+    parser.add_argument('--database-url', required=True, help='отдельная база для теста (данные будут изменены)')
+    parser.add_argument('--duration', type=float, default=30, help='длительность нагрузки, с')
+    parser.add_argument('--rate', default=DEFAULT_RATES, help='частоты сценариев: имя=запусков в секунду,...')
+    parser.add_argument('--seed-kb', type=int, default=500, help='размер начального ассортимента, КБ')
+    parser.add_argument('--assortment-kb', type=int, default=200, help='размер загружаемого в сценарии ассортимента, КБ')
+    parser.add_argument('--arrival-items', type=int, default=5, help='товаров в одном прибытии')
+    parser.add_argument('--api-latency', type=float, default=0, help='задержка ответа поддельного Bot API, мс')
+    parser.add_argument('--connections', type=int, default=100, help='одновременных соединений к вебхуку (как max_connections)')
+    parser.add_argument('--telegram-limits', action='store_true', help='оставить лимиты Bot API из outbound.py')
+    parser.add_argument('--port', type=int, default=8765, help='порт приложения')
+    parser.add_argument('--api-port', type=int, default=8766, help='порт поддельного Bot API')
+    parser.add_argument('--random-seed', type=int, default=1)
+    parser.add_argument('--json', help='сохранить результаты в файл JSON')
+    args = parser.parse_args()
+    rates = {}
+    for item in args.rate.split(','):
+        name, _, value = item.partition('=')
+        if name.strip() not in SCENARIOS:
+            parser.error(f"неизвестный сценарий: {name}")
+        rates[name.strip()] = float(value)
+    args.rates = rates
+    return args
+
+def configure_environment(args):
+    """Окружение задаётся до импорта server/config: они читают его при импорте."""
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['RENDER_EXTERNAL_URL'] = f"http://127.0.0.1:{args.port}"
+    os.environ['PORT'] = str(args.port)
+    os.environ.setdefault('BOT_TOKEN', '123456:LOAD-TEST-TOKEN')
+    os.environ.setdefault('ADMIN_ID', '1')
+    os.environ.setdefault('MAIN_GROUP_ID', '-1001000000000')
+    for number, name in enumerate(['THREAD_SALES', 'THREAD_ASSORTMENT', 'THREAD_ARRIVAL', 'THREAD_PREORDER'], 1):
+        os.environ.setdefault(name, str(number))
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    if not args.telegram_limits:
+        # Поддельный Bot API не ограничивает частоту – меряем сам бот, а не ожидание лимитов
+        for name in ('TG_GLOBAL_RATE', 'TG_PRIVATE_RATE', 'TG_GROUP_PER_MINUTE'):
+            os.environ.setdefault(name, '1000000')
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+class Stats:
+    """Время ответа и число запросов к БД и Bot API по типам обновлений."""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.db_queries: dict[str, int] = {}
+        self.api_calls: dict[str, int] = {}
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def reset(self):
+        self.__init__()
+
+    def record(self, label: str, seconds: float, ok: bool):
+        self.latencies.setdefault(label, []).append(seconds)
+        if not ok:
+            self.errors[label] = self.errors.get(label, 0) + 1
+
+    def count_query(self, record):
+        label = current_label.get()
+        # Служебный сброс соединения при возврате в пул не считаем (как database._log_query)
+        if label and not record.query.startswith('SELECT pg_advisory_unlock_all()'):
+            self.db_queries[label] = self.db_queries.get(label, 0) + 1
+
+    def count_api_call(self):
+        label = current_label.get()
+        if label:
+            self.api_calls[label] = self.api_calls.get(label, 0) + 1
+
+    def summary(self) -> dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        rows = {}
+        for label in sorted(self.latencies):
+            values = self.latencies[label]
+            rows[label] = {
+                'updates': len(values),
+                'errors': self.errors.get(label, 0),
+                'p50_ms': percentile(values, 0.50) * 1000,
+                'p95_ms': percentile(values, 0.95) * 1000,
+                'p99_ms': percentile(values, 0.99) * 1000,
+                'db_per_update': self.db_queries.get(label, 0) / len(values),
+                'api_per_update': self.api_calls.get(label, 0) / len(values),
+            }
+        all_values = [value for values in self.latencies.values() for value in values]
+        total = {
+            'updates': len(all_values),
+            'errors': sum(self.errors.values()),
+            'seconds': elapsed,
+            'updates_per_second': len(all_values) / elapsed if elapsed else 0,
+        }
+        if all_values:
+            total.update({
+                'p50_ms': percentile(all_values, 0.50) * 1000,
+                'p95_ms': percentile(all_values, 0.95) * 1000,
+                'p99_ms': percentile(all_values, 0.99) * 1000,
+                'db_per_update': sum(self.db_queries.values()) / len(all_values),
+                'api_per_update': sum(self.api_calls.values()) / len(all_values),
+            })
+        return {'total': total, 'by_update': rows}
+
+def print_report(summary: dict):
+    total = summary['total']
+    print(f"\nОбновлений: {total['updates']} за {total['seconds']:.1f} с "
+          f"({total['updates_per_second']:.1f}/с), ошибок: {total['errors']}")
+    header = f"{'обновление':<20}{'кол-во':>8}{'ошибки':>8}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}{'БД/обн':>8}{'API/обн':>9}"
+    print(header)
+    print('-' * len(header))
+    rows = dict(summary['by_update'])
+    if total['updates']:
+        rows['ВСЕГО'] = total
+    for label, row in rows.items():
+        print(f"{label:<20}{row['updates']:>8}{row['errors']:>8}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+              f"{row['p99_ms']:>9.1f}{row['db_per_update']:>8.1f}{row['api_per_update']:>9.1f}")
+
+class FakeBotAPI:
+    """Поддельный Bot API: отвечает успехом на любые методы и отдаёт загруженные тестом файлы."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.files: dict[str, bytes] = {}
+        self._message_id = 0
+        self._runner = None
+
+    def _message(self, data) -> dict:
+        self._message_id += 1
+        chat_id = int(data.get('chat_id') or 0)
+        message = {'message_id': self._message_id, 'date': int(time.time()),
+                   'chat': {'id': chat_id, 'type': 'supergroup' if chat_id < 0 else 'private'}}
+        if 'text' in data:
+            message['text'] = data['text']
+        if 'document' in data:
+            message['document'] = {'file_id': f"sent{self._message_id}", 'file_unique_id': f"sent{self._message_id}"}
+        return message
+
+    async def _api(self, request):
+        from aiohttp import web
+        method = request.match_info['method']
+        data = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == 'getWebhookInfo':
+            result = {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        elif method == 'getMe':
+            result = {'id': 123456, 'is_bot': True, 'first_name': 'LoadTest', 'username': 'load_test_bot'}
+        elif method == 'getFile':
+            file_id = data['file_id']
+            result = {'file_id': file_id, 'file_unique_id': file_id, 'file_size': len(self.files.get(file_id, b'')),
+                      'file_path': f"documents/{file_id}"}
+        elif method.startswith(('send', 'edit', 'copy', 'forward')):
+            result = self._message(data)
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _file(self, request):
+        from aiohttp import web
+        body = self.files.get(request.match_info['path'].rpartition('/')[2])
+        if body is None:
+            return web.Response(status=404)
+        return web.Response(body=body, content_type='text/plain')
+
+    async def start(self, port: int):
+        from aiohttp import web
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self._api)
+        app.router.add_get('/file/bot{token}/{path:.+}', self._file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', port).start()
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+class LabelledApp:
+    """ASGI-обёртка: тип обновления из заголовка запроса доступен коду бота через current_label."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            for name, value in scope['headers']:
+                if name == LABEL_HEADER.encode():
+                    current_label.set(value.decode())
+        await self.app(scope, receive, send)
+
+class LoadTest:
+    def __init__(self, args, config, stats: Stats, api: FakeBotAPI):
+        self.args = args
+        self.config = config
+        self.stats = stats
+        self.api = api
+        self.rng = random.Random(args.random_seed)
+        self.serials: list[str] = []
+        self.url = f"http://127.0.0.1:{args.port}/webhook"
+        self._update_id = 0
+        self._message_id = 0
+        self._user_id = 10 ** 9
+        self._session = None
+
+    def _next_user(self) -> dict:
+        # Свой пользователь на каждый сценарий с подтверждением: состояния FSM не пересекаются
+        self._user_id += 1
+        return {'id': self._user_id, 'is_bot': False, 'first_name': 'Load'}
+
+    def _message(self, user: dict, thread_id: int | None = None, **content) -> dict:
+        self._message_id += 1
+        chat = ({'id': self.config.MAIN_GROUP_ID, 'type': 'supergroup', 'is_forum': True} if thread_id
+                else {'id': user['id'], 'type': 'private'})
+        message = {'message_id': self._message_id, 'date': int(time.time()), 'chat': chat, 'from': user, **content}
+        if thread_id:
+            message.update(message_thread_id=thread_id, is_topic_message=True)
+        return message
+
+    def _callback(self, user: dict, data: str, thread_id: int | None = None) -> dict:
+        message = self._message({'id': 123456, 'is_bot': True, 'first_name': 'LoadTest'}, thread_id, text='…')
+        if not thread_id:
+            message['chat'] = {'id': user['id'], 'type': 'private'}
+        return {'callback_query': {'id': str(self._update_id), 'from': user, 'chat_instance': '1',
+                                   'data': data, 'message': message}}
+
+    async def post(self, label: str, update: dict):
+        self._update_id += 1
+        update = {'update_id': self._update_id, **update}
+        started = time.perf_counter()
+        ok = False
+        try:
+            async with self._session.post(self.url, json=update, headers={LABEL_HEADER: label}) as response:
+                await response.read()
+                ok = response.status == 200
+        except Exception as e:
+            print(f"⚠️ {label}: {e!r}", file=sys.stderr)
+        self.stats.record(label, time.perf_counter() - started, ok)
+
+    def _take_serials(self, count: int) -> list[str]:
+        taken = []
+        for _ in range(min(count, len(self.serials))):
+            taken.append(self.serials.pop(self.rng.randrange(len(self.serials))))
+        return taken
+
+    async def sales(self):
+        text = synthetic.sale_text(self.rng, self._take_serials(self.rng.randint(1, 3)))
+        await self.post('sale', {'message': self._message(self._next_user(), self.config.THREAD_SALES, text=text)})
+
+    async def bookings(self):
+        text = synthetic.booking_text(self.rng, self._take_serials(self.rng.randint(1, 2)))
+        await self.post('booking', {'message': self._message(self._next_user(), self.config.THREAD_PREORDER, text=text)})
+
+    async def arrivals(self):
+        user = self._next_user()
+        text, serials = synthetic.arrival_text(self.rng, self.args.arrival_items)
+        await self.post('arrival', {'message': self._message(user, self.config.THREAD_ARRIVAL, text=text)})
+        await self.post('arrival_confirm', self._callback(user, 'arrival_confirm:yes', self.config.THREAD_ARRIVAL))
+        self.serials.extend(serials)
+
+    async def assortment(self, size_kb: int | None = None):
+        user = self._next_user()
+        text, serials = synthetic.assortment_text(self.rng, (size_kb or self.args.assortment_kb) * 1024)
+        body = text.encode('utf-8')
+        file_id = f"assortment{self._update_id}"
+        self.api.files[file_id] = body
+        document = {'file_id': file_id, 'file_unique_id': file_id, 'file_name': 'assortment.txt',
+                    'mime_type': 'text/plain', 'file_size': len(body)}
+        await self.post('assortment', {'message': self._message(user, self.config.THREAD_ASSORTMENT, document=document)})
+        await self.post('assortment_confirm', self._callback(user, 'assort_confirm:yes', self.config.THREAD_ASSORTMENT))
+        self.api.files.pop(file_id, None)
+        # Загруженные категории приведены к новому списку – продаём только из него
+        self.serials = serials
+
+    async def menu(self):
+        admin = {'id': self.config.ADMIN_ID, 'is_bot': False, 'first_name': 'Admin'}
+        action = self.rng.choice(MENU_ACTIONS)
+        await self.post(f"menu:{action}", self._callback(admin, f"menu:{action}"))
+
+    async def _run_scenario(self, name: str, rate: float, deadline: float, running: set):
+        scenario = getattr(self, name)
+        next_start = time.perf_counter()
+        while True:
+            next_start += self.rng.expovariate(rate)
+            if next_start >= deadline:
+                return
+            await asyncio.sleep(max(0.0, next_start - time.perf_counter()))
+            # Открытая модель: новые запуски не ждут завершения предыдущих
+            task = asyncio.create_task(scenario())
+            running.add(task)
+            task.add_done_callback(running.discard)
+
+    async def run(self):
+        import aiohttp
+        connector = aiohttp.TCPConnector(limit=self.args.connections)
+        async with aiohttp.ClientSession(connector=connector) as self._session:
+            print(f"Начальный ассортимент {self.args.seed_kb} КБ...")
+            await self.assortment(self.args.seed_kb)
+            print(f"Товаров в наличии: {len(self.serials)}. Нагрузка {self.args.duration:.0f} с: {self.args.rate}")
+            self.stats.reset()
+            running: set[asyncio.Task] = set()
+            deadline = time.perf_counter() + self.args.duration
+            await asyncio.gather(*[self._run_scenario(name, rate, deadline, running)
+                                   for name, rate in self.args.rates.items() if rate > 0])
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+            self.stats.finished = time.perf_counter()
+
+SCENARIOS = ('sales', 'bookings', 'arrivals', 'assortment', 'menu')
+
+async def run(args):
+    configure_environment(args)
+    import uvicorn
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+    import config
+    import database
+    import server
+
+    stats = Stats()
+
+    # Каждое соединение пула дополнительно считает свои запросы по типам обновлений
+    init_connection = database._init_connection
+    async def counting_init_connection(conn):
+        await init_connection(conn)
+        conn.add_query_logger(stats.count_query)
+    database._init_connection = counting_init_connection
+
+    class CountingMiddleware(BaseRequestMiddleware):
+        async def __call__(self, make_request, bot, method):
+            stats.count_api_call()
+            return await make_request(bot, method)
+
+    api = FakeBotAPI(args.api_latency / 1000)
+    await api.start(args.api_port)
+    server.bot.session.api = TelegramAPIServer.from_base(f"http://127.0.0.1:{args.api_port}")
+    server.bot.session.middleware(CountingMiddleware())
+
+    uvicorn_server = uvicorn.Server(uvicorn.Config(LabelledApp(server.app), host='127.0.0.1', port=args.port,
+                                                   log_config=None, access_log=False, lifespan='on'))
+    serve_task = asyncio.create_task(uvicorn_server.serve())
+    try:
+        while not uvicorn_server.started:
+            if serve_task.done():
+                serve_task.result()
+                raise RuntimeError('приложение не запустилось')
+            await asyncio.sleep(0.05)
+        await LoadTest(args, config, stats, api).run()
+    finally:
+        uvicorn_server.should_exit = True
+        await serve_task
+        await api.stop()
+
+    summary = stats.summary()
+    print_report(summary)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+if __name__ == '__main__':
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,93 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+
+from aiogram import Bot
+
+from database import get_pool
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_REGISTRY_SIZE = int(os.environ.get('MESSAGE_REGISTRY_SIZE', 10000))
+# Бот может удалять сообщения только в течение 48 часов после отправки
+MESSAGE_REGISTRY_TTL = float(os.environ.get('MESSAGE_REGISTRY_TTL', 48 * 3600))
+MESSAGE_REGISTRY_PERSIST = os.environ.get('MESSAGE_REGISTRY_PERSIST', '1') == '1'
+DELETE_MESSAGES_LIMIT = 100  # максимум идентификаторов в одном deleteMessages
+
+class MessageRegistry:
+    """
+    Последние отправленные ботом сообщения по видам (например, 'stats') и чатам –
+    чтобы при повторном запросе удалить устаревшие.
+    В памяти хранится не больше size записей не старше ttl секунд.
+    При persist=True записи дублируются в таблицу tracked_messages, поэтому
+    переживают перезапуск и видны всем процессам бота.
+    """
+
+    def __init__(self, size: int = MESSAGE_REGISTRY_SIZE, ttl: float = MESSAGE_REGISTRY_TTL,
+                 persist: bool = MESSAGE_REGISTRY_PERSIST):
+        self.size = size
+        self.ttl = ttl
+        self.persist = persist
+        self._entries: OrderedDict[tuple[str, int], tuple[float, list[int]]] = OrderedDict()
+
+    async def remember(self, kind: str, chat_id: int, *message_ids: int):
+        """Запоминает сообщения вида kind в чате (заменяя запомненные ранее)."""
+        key = (kind, chat_id)
+        self._entries[key] = (time.monotonic() + self.ttl, list(message_ids))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        if not self.persist:
+            return
+        try:
+            pool = await get_pool()
+            await pool.execute('''
+                INSERT INTO tracked_messages (kind, chat_id, message_ids, sent_at)
+                VALUES ($1, $2, $3, CURRENT_TIMESTAMP)
+                ON CONFLICT (kind, chat_id) DO UPDATE SET message_ids = EXCLUDED.message_ids,
+                                                          sent_at = EXCLUDED.sent_at
+            ''', kind, chat_id, list(message_ids))
+        except Exception as e:
+            # Запись в памяти осталась (take() вернёт её) – теряется только устойчивость к перезапуску
+            logger.warning("Не удалось сохранить сообщения %s в БД: %s", kind, e)
+
+    async def take(self, chat_id: int, *kinds: str) -> list[int]:
+        """Возвращает и забывает ещё не устаревшие сообщения указанных видов в чате."""
+        now = time.monotonic()
+        message_ids = []
+        for kind in kinds:
+            expires, ids = self._entries.pop((kind, chat_id), (0, []))
+            if expires > now:
+                message_ids.extend(ids)
+        if not self.persist:
+            return message_ids
+        try:
+            pool = await get_pool()
+            rows = await pool.fetch('''
+                DELETE FROM tracked_messages
+                WHERE chat_id = $1 AND kind = ANY($2::text[])
+                RETURNING message_ids, sent_at > CURRENT_TIMESTAMP - make_interval(secs => $3) AS fresh
+            ''', chat_id, list(kinds), self.ttl)
+        except Exception as e:
+            logger.warning("Не удалось получить сообщения %s из БД: %s", kinds, e)
+            return message_ids
+        # Таблица общая для всех процессов, а в памяти могут быть записи, которые не удалось
+        # сохранить в БД – берём и те и другие без повторов
+        stored = [message_id for row in rows if row['fresh'] for message_id in row['message_ids']]
+        return list(dict.fromkeys(stored + message_ids))
+
+    async def forget(self, chat_id: int, *kinds: str):
+        """Забывает сообщения указанных видов, не удаляя их из чата."""
+        await self.take(chat_id, *kinds)
+
+    async def delete(self, bot: Bot, chat_id: int, *kinds: str):
+        """Удаляет из чата запомненные сообщения указанных видов (пачками через deleteMessages)."""
+        message_ids = await self.take(chat_id, *kinds)
+        for i in range(0, len(message_ids), DELETE_MESSAGES_LIMIT):
+            try:
+                await bot.delete_messages(chat_id, message_ids[i:i + DELETE_MESSAGES_LIMIT])
+            except Exception as e:
+                logger.warning("Не удалось удалить старые сообщения %s: %s", kinds, e)
+
+messages = MessageRegistry()
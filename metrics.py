@@ -0,0 +1,188 @@
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Метрики в формате Prometheus (text exposition 0.0.4) без внешних зависимостей.
+# Значения хранятся в памяти процесса и отдаются маршрутом /metrics.
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_metrics: list['_Metric'] = []
+_lock = threading.Lock()  # отчёты в пуле потоков тоже могут обновлять метрики
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        _metrics.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, '') for name in self.labels)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield self.name, key, '', value
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with _lock:
+            samples = list(self.samples())
+        for name, key, extra, value in samples:
+            lines.append(f'{name}{_format_labels(self.labels, key, extra)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """Текущее значение; если задан callback, значение читается при каждом сборе метрик."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), callback=None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.callback:
+            # callback возвращает число или {значения меток: число}
+            value = self.callback()
+            values = value if isinstance(value, dict) else {(): value}
+            for key, item in sorted(values.items()):
+                yield self.name, key if isinstance(key, tuple) else (key,), '', item
+        else:
+            yield from super().samples()
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket', key, f'le="{_format_value(bound)}"', cumulative
+            yield f'{self.name}_sum', key, '', total
+            yield f'{self.name}_count', key, '', cumulative
+
+class Summary(_Metric):
+    """Квантили по скользящему окну последних window наблюдений (плюс общие сумма и число)."""
+    kind = 'summary'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (),
+                 quantiles: tuple = (0.5, 0.95, 0.99), window: int = 500):
+        super().__init__(name, documentation, labels)
+        self.quantiles = quantiles
+        self.window = window
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            recent, count, total = self._values.get(key, (None, 0, 0.0))
+            if recent is None:
+                recent = deque(maxlen=self.window)
+            recent.append(value)
+            self._values[key] = (recent, count + 1, total + value)
+
+    def _quantiles(self, recent) -> dict[float, float]:
+        ordered = sorted(recent)
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in self.quantiles}
+
+    def percentiles(self, **labels) -> dict[float, float]:
+        """Квантили по окну для набора меток ({} – наблюдений не было)."""
+        with _lock:
+            entry = self._values.get(self._key(labels))
+            return self._quantiles(entry[0]) if entry else {}
+
+    def samples(self):
+        for key, (recent, count, total) in sorted(self._values.items()):
+            for q, value in self._quantiles(recent).items():
+                yield self.name, key, f'quantile="{q}"', value
+            yield f'{self.name}_sum', key, '', total
+            yield f'{self.name}_count', key, '', count
+
+def render() -> str:
+    """Все метрики процесса в текстовом формате Prometheus."""
+    return '\n'.join(metric.render() for metric in _metrics) + '\n'
+
+# ---------- Общие метрики бота ----------
+
+WEBHOOK_SECONDS = Histogram('bot_webhook_seconds', 'Обработка запроса вебхука', ('status',))
+HANDLER_SECONDS = Histogram('bot_handler_seconds', 'Время работы обработчика aiogram', ('event', 'handler'))
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Исключения в обработчиках aiogram', ('event', 'handler'))
+DB_CALL_SECONDS = Histogram('bot_db_call_seconds', 'Время вызова функции database.py', ('function',))
+DB_CALL_LATENCY = Summary(
+    'bot_db_call_latency_seconds', 'Квантили времени вызова функции database.py по обработчикам',
+    ('function', 'handler')
+)
+DB_CALL_ERRORS = Counter('bot_db_call_errors_total', 'Ошибки функций database.py', ('function', 'error'))
+DB_POOL_WAIT_SECONDS = Histogram(
+    'bot_db_pool_wait_seconds', 'Ожидание свободного соединения в пуле',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+)
+TELEGRAM_SECONDS = Histogram('bot_telegram_request_seconds', 'Запросы к Bot API', ('method', 'status'))
+CACHE_REQUESTS = Counter('bot_cache_requests_total', 'Обращения к кешам', ('cache', 'result'))
+
+def cache_hit(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
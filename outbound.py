@@ -0,0 +1,139 @@
+import os
+import time
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Bot API: ~30 сообщений в секунду всего, ~1 в секунду в личный чат
+# (короткие серии Telegram допускает), ~20 в минуту в группу
+TG_GLOBAL_RATE = float(os.environ.get('TG_GLOBAL_RATE', 30))
+TG_PRIVATE_RATE = float(os.environ.get('TG_PRIVATE_RATE', 1))
+TG_PRIVATE_BURST = float(os.environ.get('TG_PRIVATE_BURST', 5))
+TG_GROUP_PER_MINUTE = float(os.environ.get('TG_GROUP_PER_MINUTE', 20))
+TG_RETRY_LIMIT = int(os.environ.get('TG_RETRY_LIMIT', 3))
+# Дольше этого запрос лимита не ждёт (он держит ответ на вебхук) и уходит сразу –
+# если Telegram действительно против, он ответит retry_after
+TG_MAX_WAIT = float(os.environ.get('TG_MAX_WAIT', 1))
+MAX_CHAT_BUCKETS = 10000
+
+OUTBOUND_QUEUE = metrics.Gauge('bot_outbound_queue', 'Запросы к Bot API, ожидающие лимита')
+RETRY_AFTER = metrics.Counter('bot_telegram_retry_after_total', 'Ответы Bot API с retry_after', ('method',))
+OVER_LIMIT = metrics.Counter('bot_outbound_over_limit_total', 'Запросы к Bot API, отправленные без ожидания лимита',
+                             ('method',))
+
+class TokenBucket:
+    """Не больше rate запросов в секунду с запасом capacity; ожидающие обслуживаются по очереди."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        # Запас пополняется только в acquire – здесь считаем его на текущий момент
+        now = time.monotonic()
+        if self._lock.locked() or now < self.blocked_until:
+            return True
+        return min(self.capacity, self.tokens + (now - self.updated) * self.rate) < self.capacity
+
+    def pause(self, seconds: float):
+        """Не выдаёт токены seconds секунд (после retry_after от Telegram)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self, deadline: float | None = None) -> bool:
+        """
+        Ждёт токен. Если его не будет к deadline (time.monotonic()), возвращает False без ожидания;
+        паузу после retry_after выжидает всегда.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+                if deadline is not None and now >= self.blocked_until and now + wait > deadline:
+                    return False
+                await asyncio.sleep(wait)
+
+def _counts_for_chat(api_method: str) -> bool:
+    # В лимит чата идут только новые сообщения; изменения, реакции, удаление
+    # и ответы на callback – только в общий
+    return api_method.startswith(('send', 'copy', 'forward'))
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: все запросы к Bot API проходят через общий лимит
+    и лимит своего чата, но ждут его не дольше TG_MAX_WAIT – запросы отправляются
+    во время обработки вебхука. При retry_after запрос повторяется после паузы
+    (на это время приостанавливается и весь чат).
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(TG_GLOBAL_RATE, TG_GLOBAL_RATE)
+        self._chats: OrderedDict[int | str, TokenBucket] = OrderedDict()
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(TG_GROUP_PER_MINUTE / 60, TG_GROUP_PER_MINUTE)
+            else:
+                bucket = TokenBucket(TG_PRIVATE_RATE, max(TG_PRIVATE_BURST, 1))
+            self._chats[chat_id] = bucket
+            if len(self._chats) > MAX_CHAT_BUCKETS:
+                self._evict()
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def _evict(self):
+        """Вытесняет давно неиспользуемые чаты, чей лимит уже восстановился."""
+        excess = len(self._chats) - MAX_CHAT_BUCKETS
+        # Проверяем с начала (самые старые) не больше вдвое от лишнего: занятые чаты пропускаются,
+        # и словарь не перебирается целиком на каждом новом чате. Последний – только что добавленный
+        scan = min(excess * 2, len(self._chats) - 1)
+        for stale_id in list(itertools.islice(self._chats, scan)):
+            if excess <= 0:
+                break
+            if not self._chats[stale_id].busy:
+                del self._chats[stale_id]
+                excess -= 1
+
+    async def __call__(self, make_request, bot, method):
+        api_method = method.__api_method__
+        chat_id = getattr(method, 'chat_id', None)
+        chat_bucket = self._chat_bucket(chat_id) if chat_id is not None and _counts_for_chat(api_method) else None
+        for attempt in range(TG_RETRY_LIMIT + 1):
+            deadline = time.monotonic() + TG_MAX_WAIT
+            OUTBOUND_QUEUE.inc()
+            try:
+                within_limit = await chat_bucket.acquire(deadline) if chat_bucket else True
+                within_limit = await self.global_bucket.acquire(deadline) and within_limit
+            finally:
+                OUTBOUND_QUEUE.dec()
+            if not within_limit:
+                OVER_LIMIT.inc(method=api_method)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                RETRY_AFTER.inc(method=api_method)
+                if attempt == TG_RETRY_LIMIT:
+                    raise
+                logger.warning("⏳ %s: Telegram просит подождать %s с (чат %s)", api_method, e.retry_after, chat_id)
+                (chat_bucket or self.global_bucket).pause(e.retry_after)
@@ -0,0 +1,67 @@
+"""
+Построители отчётов, которые выполняются в пуле процессов (workers.run_report с heavy=True).
+Дочерний процесс импортирует этот модуль, поэтому здесь только стандартная библиотека
+и sort_assortment – без aiogram и database. Потоковая выгрузка CSV – в csv_export.py.
+"""
+import csv
+import io
+from datetime import date, timedelta
+
+from sort_assortment import build_output_text
+
+# ---------- Отчёт по клиентам за месяц ----------
+
+MONTH_REPORT_HEADER = [
+    'ID клиента', 'ФИО', 'Телефон', 'Все телефоны', 'Telegram', 'Соцсети', 'Источник',
+    'Дата регистрации клиента',
+    'ID покупки', 'Дата покупки', 'Товары', 'Сумма', 'Способ оплаты (JSON)', 'Тип покупки'
+]
+
+def is_closed_month(month_str: str, today: date | None = None) -> bool:
+    """
+    Месяц (MM.YYYY) считается закрытым, если он закончился раньше вчерашнего дня –
+    запас в сутки на случай расхождения часовых поясов бота и БД.
+    """
+    month, year = map(int, month_str.split('.'))
+    next_month = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    today = today or date.today()
+    return next_month <= today - timedelta(days=1)
+
+def build_month_csv(rows: list) -> bytes:
+    """Формирует CSV с клиентами и покупками за месяц (строки из get_clients_data_for_month)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(MONTH_REPORT_HEADER)
+    for row in rows:
+        writer.writerow([
+            row['client_id'],
+            row['full_name'],
+            row['phone'],
+            row['phones'],
+            row['telegram_username'],
+            row['social_network'],
+            row['referral_source'],
+            row['client_created_at'],
+            row['purchase_id'],
+            row['purchase_created_at'],
+            row['items_text'],
+            row['total_amount'],
+            row['payment_details'],
+            row['purchase_type']
+        ])
+    return buffer.getvalue().encode('utf-8')
+
+# ---------- Остатки и ассортимент ----------
+
+def build_remains_csv(groups: dict) -> bytes:
+    """CSV остатков: {(модель, тип SIM): количество} -> байты файла."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['Модель', 'Тип SIM', 'Количество'])
+    for (full_name, sim), count in sorted(groups.items()):
+        writer.writerow([full_name, sim if sim != 'other' else '', count])
+    return buffer.getvalue().encode('utf-8')
+
+def build_assortment_file(categories: list) -> bytes:
+    """Текстовый файл ассортимента (с сортировкой внутри категорий)."""
+    return build_output_text(categories).encode('utf-8')
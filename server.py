@@ -0,0 +1,241 @@
+import time
+_process_started = time.perf_counter()
+import os
+import logging
+import signal
+import sys
+import asyncio
+import traceback
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.middleware.base import BaseHTTPMiddleware
+import uvicorn
+
+from log_config import setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+try:
+    logger.info("Импортируем config...")
+    import config
+    logger.info("Импортируем router из handlers...")
+    from handlers import router
+    logger.info("Импортируем init_db из database...")
+    from database import init_db, db_caller
+    import workers
+    import metrics
+    logger.info("Импортируем aiogram...")
+    from aiogram import Bot, Dispatcher, BaseMiddleware
+    from aiogram.types import Update
+    from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+    from fsm_storage import PostgresStorage
+    from outbound import OutboundScheduler
+    logger.info("Все импорты успешны (%.0f мс).", (time.perf_counter() - _process_started) * 1000)
+except Exception as e:
+    print("=" * 60, file=sys.stderr)
+    print("CRITICAL ERROR DURING IMPORT:", file=sys.stderr)
+    traceback.print_exc(file=sys.stderr)
+    print("=" * 60, file=sys.stderr)
+    sys.exit(1)
+
+try:
+    logger.info("Создаём экземпляр Bot...")
+    bot = Bot(token=config.TOKEN)
+    logger.info("Создаём Dispatcher...")
+    dp = Dispatcher(storage=PostgresStorage())
+    dp.include_router(router)
+    metrics.Gauge('bot_fsm_pending_writes', 'Несохранённые изменения состояний FSM', callback=lambda: dp.storage.pending)
+    RENDER_URL = os.environ.get('RENDER_EXTERNAL_URL')
+    PORT = int(os.environ.get('PORT', 8000))
+    WEBHOOK_MAX_CONNECTIONS = 100
+    logger.info("RENDER_URL: %s, PORT: %s", RENDER_URL, PORT)
+except Exception as e:
+    print("=" * 60, file=sys.stderr)
+    print("ERROR DURING BOT INITIALIZATION:", file=sys.stderr)
+    traceback.print_exc(file=sys.stderr)
+    print("=" * 60, file=sys.stderr)
+    sys.exit(1)
+
+class LoggingMiddleware(BaseHTTPMiddleware):
+    """Одна строка лога на запрос: метод, путь, код ответа и время обработки."""
+
+    async def dispatch(self, request: Request, call_next):
+        started = time.perf_counter()
+        try:
+            response = await call_next(request)
+            logger.info("%s %s -> %s (%.1f мс)", request.method, request.url.path, response.status_code,
+                        (time.perf_counter() - started) * 1000)
+            return response
+        except Exception as e:
+            logger.exception("💥 Необработанное исключение при обработке запроса %s: %s", request.url.path, e)
+            return Response(status_code=500)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время работы и ошибки каждого обработчика aiogram; запросы к БД из обработчика помечаются его именем."""
+
+    async def __call__(self, handler, event, data):
+        labels = {'event': type(event).__name__, 'handler': data['handler'].callback.__name__}
+        token = db_caller.set(labels['handler'])
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.HANDLER_ERRORS.inc(**labels)
+            raise
+        finally:
+            metrics.HANDLER_SECONDS.observe(time.perf_counter() - started, **labels)
+            db_caller.reset(token)
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Время запросов к Bot API по методам."""
+
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            response = await make_request(bot, method)
+            status = 'ok'
+            return response
+        finally:
+            metrics.TELEGRAM_SECONDS.observe(
+                time.perf_counter() - started, method=method.__api_method__, status=status
+            )
+
+for event_name, observer in dp.observers.items():
+    if event_name not in ('update', 'error'):
+        observer.middleware(HandlerMetricsMiddleware())
+# Планировщик – внешний слой: метрики запросов не включают ожидание лимитов
+bot.session.middleware(OutboundScheduler())
+bot.session.middleware(TelegramMetricsMiddleware())
+
+def _webhook_matches(info, url: str, allowed_updates: list[str]) -> bool:
+    return (info.url == url and info.max_connections == WEBHOOK_MAX_CONNECTIONS
+            and set(info.allowed_updates or []) == set(allowed_updates))
+
+async def setup_webhook(retries=3):
+    """
+    Устанавливает вебхук, если он ещё не указывает на этот сервис с теми же параметрами.
+    Накопившиеся за время перезапуска обновления не сбрасываются.
+    """
+    logger.info("🌐 RENDER_EXTERNAL_URL = %s", RENDER_URL)
+    if not RENDER_URL:
+        logger.error("❌ RENDER_EXTERNAL_URL не задан! Вебхук не будет установлен.")
+        return False
+    webhook_url = f"{RENDER_URL}/webhook"
+    allowed_updates = dp.resolve_used_update_types()
+    for attempt in range(1, retries+1):
+        try:
+            webhook_info = await bot.get_webhook_info()
+            if _webhook_matches(webhook_info, webhook_url, allowed_updates):
+                logger.info("✅ Вебхук уже установлен на %s (ожидают обработки: %s)",
+                            webhook_url, webhook_info.pending_update_count)
+                return True
+            logger.info("🔗 Попытка %s установить вебхук на %s (сейчас: %s)", attempt, webhook_url, webhook_info.url or 'нет')
+            result = await bot.set_webhook(
+                url=webhook_url,
+                allowed_updates=allowed_updates,
+                max_connections=WEBHOOK_MAX_CONNECTIONS
+            )
+            if result:
+                logger.info("✅ Вебхук успешно установлен на %s", webhook_url)
+                return True
+            logger.warning("⚠️ Попытка %s: set_webhook вернул False", attempt)
+        except Exception as e:
+            logger.exception("❌ Ошибка при установке вебхука (попытка %s): %s", attempt, e)
+        if attempt < retries:
+            wait = 2 ** attempt
+            logger.info("⏳ Повтор через %s секунд...", wait)
+            await asyncio.sleep(wait)
+    logger.error("❌ Не удалось установить вебхук после нескольких попыток.")
+    return False
+
+async def prepare_database():
+    try:
+        await init_db()
+        logger.info("✅ База данных инициализирована.")
+    except Exception as e:
+        logger.exception("❌ Ошибка при инициализации БД")
+
+async def timed_phase(name: str, coro):
+    """Выполняет этап запуска и пишет в лог его длительность."""
+    started = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        logger.info("⏱️ %s: %.0f мс", name, (time.perf_counter() - started) * 1000)
+
+async def on_startup():
+    # БД и вебхук не зависят друг от друга – готовим их одновременно
+    logger.info("Запуск on_startup: инициализация БД и проверка вебхука...")
+    await asyncio.gather(
+        timed_phase("Инициализация БД", prepare_database()),
+        timed_phase("Проверка вебхука", setup_webhook())
+    )
+    logger.info("🚀 Готов к приёму обновлений через %.1f с после старта", time.perf_counter() - _process_started)
+
+async def on_shutdown():
+    # Вебхук не удаляем: при перезапуске или деплое Telegram придержит обновления
+    # и доставит их новому экземпляру, а не потеряет.
+    # Хранилище FSM дописывает в БД изменения, ещё не сохранённые в фоне
+    await dp.storage.close()
+    workers.shutdown()
+    await bot.session.close()
+
+async def webhook(request: Request) -> Response:
+    started = time.perf_counter()
+    status = 200
+    try:
+        update_data = await request.json()
+        logger.debug("📨 Получено обновление от Telegram: update_id=%s", update_data.get('update_id'))
+        update = Update(**update_data)
+        try:
+            await dp.feed_update(bot, update)
+        finally:
+            # Изменения состояния за обновление сохраняются одним запросом до ответа:
+            # следующее обновление этого чата может обработать другой процесс
+            await dp.storage.flush()
+        return Response(status_code=200)
+    except Exception as e:
+        status = 500
+        logger.exception("❌ Ошибка при обработке вебхука: %s", e)
+        return Response(status_code=500)
+    finally:
+        metrics.WEBHOOK_SECONDS.observe(time.perf_counter() - started, status=status)
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+async def health(request: Request) -> PlainTextResponse:
+    return PlainTextResponse("OK")
+
+app = Starlette(
+    routes=[
+        Route("/webhook", webhook, methods=["POST"]),
+        Route("/health", health, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+        Route("/", health, methods=["GET"]),
+    ],
+    on_startup=[on_startup],
+    on_shutdown=[on_shutdown],
+)
+
+app.add_middleware(LoggingMiddleware)
+
+def handle_signal(sig, frame):
+    logger.info("⏹️ Получен сигнал %s, завершаем работу...", sig)
+    sys.exit(0)
+
+def run():
+    """Запускает сервер (python main.py)."""
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    try:
+        logger.info("🚀 Запуск сервера на порту %s", PORT)
+        # Запросы логирует LoggingMiddleware, собственные настройки логов uvicorn не нужны
+        uvicorn.run(app, host="0.0.0.0", port=PORT, log_config=None, access_log=False)
+    except Exception as e:
+        logger.exception("💥 Критическая ошибка при запуске: %s", e)
+        sys.exit(1)
@@ -1,4 +1,5 @@
 import re
+from collections import deque
 
 def normalize_name(name):
     return ' '.join(name.split())
@@ -60,74 +61,102 @@ def extract_base_name(item):
     base = normalize_model(base)
     return base
 
-def parse_categories(lines):
-    categories = []
-    current_header = None
-    current_items = []
-    i = 0
-    n = len(lines)
-
-    while i < n:
-        stripped = lines[i].rstrip('\n')
-        trimmed = stripped.strip()
-        if trimmed == '':
-            i += 1
-            continue
+def get_item_attributes(item):
+    """
+    Возвращает разобранные характеристики товара, которые хранятся
+    в отдельных колонках таблицы items и используются для группировки в SQL.
+    """
+    return {
+        'model_name': get_full_model_name(item),
+        'base_name': extract_base_name(item),
+        'memory': extract_memory(item),
+        'sim_type': detect_sim_type(item),
+        'watch_size': extract_watch_size(item),
+    }
+
+_DASH_LINE_RE = re.compile(r'^\s*-+\s*$')
+_DASHED_LABEL_RE = re.compile(r'^-\s*[^-]+\s*-$')
+
+def _header_text(line):
+    header_text = line.strip().strip('- ').strip()
+    if header_text.endswith(':'):
+        header_text = header_text[:-1].strip()
+    return normalize_name(header_text)
+
+class CategoryParser:
+    """
+    Потоковый парсер ассортимента.
+    Строки подаются по одной через feed(), результат возвращает close().
+    Повторяющиеся заголовки объединяются через словарь, поэтому разбор
+    линейный и не требует держать весь текст в памяти.
+    """
 
+    def __init__(self):
+        self._categories = {}
+        self._header = None
+        self._items = []
+        # Буфер для заголовка вида «-----» / «Название:» / «-----»
+        self._pending = deque()
+
+    def feed(self, line):
+        self._pending.append(line)
+        self._drain(final=False)
+
+    def close(self):
+        self._drain(final=True)
+        if self._header is not None:
+            self._flush()
+        return list(self._categories.values())
+
+    def _drain(self, final):
+        pending = self._pending
+        while pending:
+            stripped = pending[0].rstrip('\n')
+            if _DASH_LINE_RE.match(stripped):
+                # Ждём две следующие строки, чтобы распознать трёхстрочный заголовок
+                if not final and (len(pending) == 1 or (len(pending) == 2 and ':' in pending[1])):
+                    return
+                pending.popleft()
+                if len(pending) >= 2 and ':' in pending[0] and _DASH_LINE_RE.match(pending[1]):
+                    self._start_category(_header_text(pending.popleft()))
+                    pending.popleft()
+                continue
+            pending.popleft()
+            self._feed_line(stripped)
+
+    def _feed_line(self, stripped):
+        trimmed = stripped.strip()
+        if not trimmed:
+            return
         if trimmed.startswith('-') and trimmed.endswith('-') and ':' in trimmed:
-            if current_header is not None:
-                _add_category(categories, current_header, current_items)
-                current_items = []
-            header_text = trimmed.strip('- ').strip()
-            if header_text.endswith(':'):
-                header_text = header_text[:-1].strip()
-            current_header = normalize_name(header_text)
-            i += 1
-            continue
-
-        if (re.match(r'^\s*-+\s*$', stripped) and
-            i + 1 < n and ':' in lines[i + 1] and
-            i + 2 < n and re.match(r'^\s*-+\s*$', lines[i + 2])):
-            if current_header is not None:
-                _add_category(categories, current_header, current_items)
-                current_items = []
-            header_line = lines[i + 1].strip()
-            header_text = header_line.strip('- ').strip()
-            if header_text.endswith(':'):
-                header_text = header_text[:-1].strip()
-            current_header = normalize_name(header_text)
-            i += 3
-            continue
-
-        if re.match(r'^\s*-+\s*$', stripped):
-            i += 1
-            continue
-
-        if re.match(r'^-\s*[^-]+\s*-$', trimmed):
-            i += 1
-            continue
-
-        if trimmed.endswith(':'):
-            i += 1
-            continue
-
-        if current_header is None:
-            current_header = "Общее:"
-        current_items.append(stripped)
-        i += 1
-
-    if current_header is not None:
-        _add_category(categories, current_header, current_items)
-
-    return categories
-
-def _add_category(categories, header, items):
-    norm_header = header.lower().rstrip(':')
-    for cat in categories:
-        if cat['header'].lower().rstrip(':') == norm_header:
-            cat['items'].extend(items)
+            self._start_category(_header_text(trimmed))
+            return
+        if _DASHED_LABEL_RE.match(trimmed) or trimmed.endswith(':'):
             return
-    categories.append({"header": header, "items": items})
+        if self._header is None:
+            self._header = "Общее:"
+        self._items.append(stripped)
+
+    def _start_category(self, header):
+        if self._header is not None:
+            self._flush()
+            self._items = []
+        self._header = header
+
+    def _flush(self):
+        key = self._header.lower().rstrip(':')
+        existing = self._categories.get(key)
+        if existing is not None:
+            existing['items'].extend(self._items)
+        else:
+            self._categories[key] = {"header": self._header, "items": self._items}
+
+def parse_categories(lines):
+    """Разбирает строки ассортимента (список, файл или любой итератор строк)."""
+    parser = CategoryParser()
+    for line in lines:
+        parser.feed(line)
+    return parser.close()
 
 def sort_assortment_to_categories(input_text):
     """Парсит текст и возвращает категории с товарами (без сортировки внутри)."""
@@ -1,26 +1,22 @@
 import asyncpg
 from datetime import date
 import config
-from database import add_sale, get_today_stats, get_pool
+from database import (
+    add_sale, add_preorder, add_booking, get_today_stats, get_range_stats, get_daily_summary,
+    reset_day_stats, get_pool
+)
 
 async def increment_preorder(cash=0.0, terminal=0.0, qr=0.0, installment=0.0):
     """Добавляет запись о предзаказе."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        await conn.execute('''
-            INSERT INTO preorders (cash, terminal, qr, installment)
-            VALUES ($1, $2, $3, $4)
-        ''', cash, terminal, qr, installment)
+    await add_preorder(cash, terminal, qr, installment)
 
 async def increment_booking(serial: str, amount: float):
     """Добавляет бронь по серийному номеру."""
     pool = await get_pool()
     async with pool.acquire() as conn:
         row = await conn.fetchrow('SELECT id FROM items WHERE UPPER(serial) = $1', serial.upper())
-        if row:
-            await conn.execute('''
-                INSERT INTO bookings (item_id, total_amount) VALUES ($1, $2)
-            ''', row['id'], amount)
+    if row:
+        await add_booking(row['id'], amount)
 
 async def increment_sales(count=1, cash=0.0, terminal=0.0, qr=0.0, installment=0.0, item_id=None, is_accessory=False):
     """Добавляет запись о продаже."""
@@ -30,15 +26,17 @@ async def get_stats():
     """Возвращает статистику за сегодня."""
     return await get_today_stats()
 
+async def get_stats_for_range(date_from: date, date_to: date):
+    """Возвращает суммарную статистику за период (даты включительно)."""
+    return await get_range_stats(date_from, date_to)
+
+async def get_stats_by_day(date_from: date, date_to: date):
+    """Возвращает статистику за период с разбивкой по дням."""
+    return await get_daily_summary(date_from, date_to)
+
 async def reset_stats():
-    """Сбрасывает статистику за сегодня."""
-    today = date.today()
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.transaction():
-            await conn.execute('DELETE FROM preorders WHERE DATE(created_at) = $1', today)
-            await conn.execute('DELETE FROM bookings WHERE DATE(booked_at) = $1', today)
-            await conn.execute('DELETE FROM sales WHERE DATE(sold_at) = $1', today)
+    """Сбрасывает статистику за сегодня (записи продаж сохраняются)."""
+    await reset_day_stats(date.today())
 
 async def reset_finances():
     """Алиас для reset_stats (для совместимости)."""
@@ -0,0 +1,95 @@
+import random
+import string
+
+# Синтетические данные в формате магазина: ассортимент поставщика, продажи, брони, прибытия.
+# Используются нагрузочным тестом (load_test.py) и бенчмарком разборщиков (bench_parsers.py).
+
+IPHONES = ['iPhone 13', 'iPhone 14', 'iPhone 15', 'iPhone 15 Pro', 'iPhone 15 Pro Max',
+           'iPhone 16', 'iPhone 16 Plus', 'iPhone 16 Pro', 'iPhone 16 Pro Max']
+IPHONE_MEMORY = ['128GB', '256GB', '512GB', '1TB']
+IPHONE_COLORS = ['Black', 'White', 'Blue', 'Pink', 'Natural Titanium', 'Desert Titanium', 'Black Titanium']
+SIM_TYPES = ['(eSIM)', '(SIM+eSIM)', '']
+WATCHES = ['Apple Watch S9', 'Apple Watch S10', 'Apple Watch Ultra 2', 'Apple Watch SE']
+WATCH_SIZES = ['40mm', '41mm', '42mm', '44mm', '45mm', '46mm', '49mm']
+WATCH_BANDS = ['Midnight Sport Band', 'Starlight Sport Loop', 'Black Titanium Milanese', 'Orange Ocean Band']
+OTHER = ['AirPods Pro 2', 'AirPods 4', 'MacBook Air 13 M3 16/512', 'iPad Air 11 M2 128GB',
+         'Samsung Galaxy S24 Ultra 256GB', 'Dyson Airwrap Complete', 'PlayStation 5 Slim']
+FIRST_NAMES = ['Иван', 'Пётр', 'Анна', 'Мария', 'Алексей', 'Ольга', 'Дмитрий', 'Екатерина']
+LAST_NAMES = ['Иванов', 'Петрова', 'Смирнов', 'Кузнецова', 'Попов', 'Соколова', 'Лебедев']
+SOURCES = ['Авито', 'Instagram', 'Telegram', 'Рекомендация друга', 'Яндекс Карты']
+PAYMENTS = ['Терминал', 'Наличные', 'QR-код', 'Рассрочка']
+
+def serial(rng: random.Random) -> str:
+    return ''.join(rng.choices(string.ascii_uppercase + string.digits, k=10)) + rng.choice('0123456789')
+
+def item_line(rng: random.Random, serial_number: str | None = None) -> str:
+    """Строка товара с серийным номером в скобках (как в ассортименте и продажах)."""
+    serial_number = serial_number or serial(rng)
+    kind = rng.random()
+    if kind < 0.6:
+        sim = rng.choice(SIM_TYPES)
+        text = f"{rng.choice(IPHONES)} {rng.choice(IPHONE_MEMORY)} {rng.choice(IPHONE_COLORS)}"
+        text += f" {sim}" if sim else ''
+    elif kind < 0.85:
+        text = f"{rng.choice(WATCHES)} {rng.choice(WATCH_SIZES)}, {rng.choice(WATCH_BANDS)}"
+    else:
+        text = rng.choice(OTHER)
+    return f"{text} ({serial_number})"
+
+def _category_of(line: str) -> str:
+    text = line.split(' (')[0].split(',')[0]
+    if text.startswith('iPhone'):
+        return ' '.join(word for word in text.split() if word not in IPHONE_COLORS and 'Titanium' not in word)
+    if text.startswith('Apple Watch'):
+        return ' '.join(text.split()[:3])
+    return ' '.join(text.split()[:2])
+
+def assortment_text(rng: random.Random, target_bytes: int) -> tuple[str, list[str]]:
+    """
+    Ассортимент поставщика примерно target_bytes байт (в основном iPhone и Apple Watch)
+    в формате «-----/Категория:/-----». Возвращает текст и серийные номера товаров.
+    """
+    categories: dict[str, list[str]] = {}
+    serials = []
+    size = 0
+    while size < target_bytes:
+        number = serial(rng)
+        line = item_line(rng, number)
+        categories.setdefault(_category_of(line), []).append(line)
+        serials.append(number)
+        size += len(line.encode('utf-8')) + 1
+    blocks = []
+    for header, items in categories.items():
+        dashes = '-' * (len(header) + 3)
+        blocks.append('\n'.join([dashes, f"{header}:", dashes, '-', *items, '']))
+    return '\n'.join(blocks), serials
+
+def client_block(rng: random.Random) -> list[str]:
+    phone = f"+7 9{rng.randint(10, 99)} {rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}"
+    return [
+        f"ФИО: {rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}",
+        phone,
+        f"@client{rng.randint(1, 10 ** 6)}",
+        f"Откуда: {rng.choice(SOURCES)}",
+    ]
+
+def sale_text(rng: random.Random, serials: list[str]) -> str:
+    """Сообщение о продаже: товары с серийными номерами, оплата и данные клиента."""
+    lines = [f"{item_line(rng, number)} - {rng.randint(20, 200) * 1000} ₽" for number in serials]
+    lines.append(f"{rng.choice(PAYMENTS)} {rng.randint(20, 200) * 1000}")
+    if rng.random() < 0.3:
+        lines.append(f"П/О {rng.randint(1, 10) * 1000}")
+    return '\n'.join(lines + client_block(rng))
+
+def booking_text(rng: random.Random, serials: list[str]) -> str:
+    """Сообщение в топике «Предзаказ»: предзаказ и блок «Бронь» с товарами."""
+    lines = [f"Предзаказ {rng.choice(IPHONES)} {rng.choice(IPHONE_MEMORY)}", f"Наличные {rng.randint(1, 10) * 1000}",
+             "Бронь:"]
+    lines += [item_line(rng, number) for number in serials]
+    lines.append(f"{rng.choice(PAYMENTS)} {rng.randint(5, 50) * 1000}")
+    return '\n'.join(lines)
+
+def arrival_text(rng: random.Random, count: int) -> tuple[str, list[str]]:
+    """Список новых товаров для топика «Прибытие» и их серийные номера."""
+    serials = [serial(rng) for _ in range(count)]
+    return '\n'.join(item_line(rng, number) for number in serials), serials
@@ -0,0 +1,67 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from functools import partial
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Пулы для построения отчётов, чтобы тяжёлые вычисления не задерживали обработку сообщений
+REPORT_THREADS = int(os.environ.get('REPORT_THREADS', 4))
+REPORT_PROCESSES = int(os.environ.get('REPORT_PROCESSES', 1))  # 0 – тяжёлые задачи тоже в потоках
+MAX_REPORT_JOBS = int(os.environ.get('MAX_REPORT_JOBS', 4))
+
+_executors: dict[str, Executor] = {}
+_jobs = asyncio.Semaphore(MAX_REPORT_JOBS)
+REPORT_JOBS = metrics.Gauge('bot_report_jobs', 'Задачи построения отчётов', ('state',))
+
+def set_executor(kind: str, executor: Executor):
+    """Подменяет пул для вида задач 'thread' или 'process' (например, в тестах)."""
+    _executors[kind] = executor
+
+def _get_executor(heavy: bool) -> Executor:
+    kind = 'process' if heavy and REPORT_PROCESSES > 0 else 'thread'
+    if kind not in _executors:
+        if kind == 'process':
+            # spawn: дочерние процессы не наследуют потоки и event loop бота. Они импортируют
+            # main.py (без побочных эффектов) и модуль функции – поэтому задачи берутся из reports.py
+            _executors[kind] = ProcessPoolExecutor(
+                max_workers=REPORT_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        else:
+            _executors[kind] = ThreadPoolExecutor(
+                max_workers=REPORT_THREADS,
+                thread_name_prefix='report'
+            )
+        logger.info("Создан пул для отчётов: %s", kind)
+    return _executors[kind]
+
+async def run_report(func, *args, heavy: bool = False):
+    """
+    Выполняет построение отчёта вне event loop.
+    По умолчанию – в пуле потоков; heavy=True – в пуле процессов
+    (func и аргументы должны сериализоваться pickle).
+    Одновременно выполняется не больше MAX_REPORT_JOBS задач, остальные ждут очереди.
+    """
+    REPORT_JOBS.inc(state='waiting')
+    try:
+        await _jobs.acquire()
+    finally:
+        REPORT_JOBS.dec(state='waiting')
+    REPORT_JOBS.inc(state='running')
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(heavy), partial(func, *args))
+    finally:
+        REPORT_JOBS.dec(state='running')
+        _jobs.release()
+
+def shutdown():
+    """Останавливает пулы (при завершении приложения)."""
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()